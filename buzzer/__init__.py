@@ -1,5 +1,5 @@
 import sys
-from math import pow
+from array import array
 
 try:
     import time
@@ -7,170 +7,666 @@ except ImportError:
     pass
 
 try:
-    import re
-except ImportError:
-    import ure as re
+    from time import ticks_us, ticks_diff, ticks_add
+except ImportError:  # CPython
+    def ticks_us():
+        return int(time.perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def ticks_add(a, b):
+        return a + b
 
 try:
-   from midi import MidiFile
+    import uasyncio as asyncio
 except ImportError:
-    MidiFile = None
+    try:
+        import asyncio
+    except ImportError:
+        asyncio = None
 
 try:
-   from rtttl import RTTTL  # https://github.com/dhylands/upy-rtttl/blob/master/rtttl.py (NOT https://github.com/GraphicHealer/MicroPython-RTTTL)
+   from midi import MidiFile
 except ImportError:
-    RTTTL = None
+    MidiFile = None
 
-SAMPLING_RATE = 1000
+if asyncio:
+    if hasattr(asyncio, 'sleep_ms'):
+        async_sleep_ms = asyncio.sleep_ms
+    else:
+        async def async_sleep_ms(ms):
+            await asyncio.sleep(ms / 1000)
 
 names = ("c", "c#", "d", "d#", "e", "f", "f#", "g", "g#", "a", "a#", "b")
 
 A4 = 440
-C0 = A4 * pow(2, -4.75)
 
-def note_freq(note):
+note_index = dict((n, i) for i, n in enumerate(names))
+
+_freq_tables = {}
+
+# 2 ** (semitone / 12) in 16.16 fixed point
+semitone_ratio = (65536, 69433, 73562, 77936, 82570, 87480, 92682, 98193, 104032, 110218, 116772, 123715)
+
+def freq_table(a4=A4):
+    """
+    Integer frequencies of all 128 MIDI notes, built once per reference pitch
+    with integer math only
+    """
+    table = _freq_tables.get(a4)
+    if table is None:
+        table = array('H')
+        for n in range(128):
+            octave, semitone = divmod(n - 69, 12)
+            scaled = a4 * semitone_ratio[semitone]
+            if octave >= 0:
+                table.append(((scaled << octave) + 0x8000) >> 16)
+            else:
+                table.append((scaled + (1 << (15 - octave))) >> (16 - octave))
+        _freq_tables[a4] = table
+    return table
+
+def note_number(note):
     n, o = note[:-1], int(note[-1])
-    index = names.index(n)
-    return int(round(pow(2, (float(o * 12 + index) / 12.0)) * C0, 2))
-
-def isplit(iterable, sep=None):
-    r = ''
-    for c in iterable:
-        r += c
-        if sep is None:
-            if not c.strip():
-                r = r[:-1]
-                if r:
-                    yield r
-                    r = ''                    
-        elif r.endswith(sep):
-            r=r[:-len(sep)]
-            yield r
-            r = ''
-    if r:
-        yield r
+    return (o + 1) * 12 + note_index[n]
+
+def midi_freq(number, table):
+    if number < 128:
+        return table[number]
+    # above the table, take the note from a lower octave and double it
+    octaves = (number - 116) // 12
+    return table[number - 12 * octaves] << octaves
+
+def freq_note(freq, table):
+    """
+    Nearest MIDI note number of a frequency
+    """
+    octaves = 0
+    while freq > table[127]:
+        freq >>= 1
+        octaves += 1
+    lo, hi = 0, 127
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if table[mid] < freq:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo and freq - table[lo - 1] < table[lo] - freq:
+        lo -= 1
+    return lo + 12 * octaves
+
+def note_freq(note, a4=A4):
+    return midi_freq(note_number(note), freq_table(a4))
+
+def itokens(chunks):
+    """
+    Split whitespace separated tokens out of str, bytes, bytearray or
+    memoryview chunks, a token may continue from one chunk to the next
+    """
+    pending = b''
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        elif isinstance(chunk, (bytearray, memoryview)):
+            # MicroPython's bytearray has no split
+            chunk = bytes(chunk)
+        if not chunk:
+            continue
+        tokens = chunk.split()
+        if pending and (not tokens or chunk[0] <= 32):
+            yield pending
+            pending = b''
+        if not tokens:
+            continue
+        if pending:
+            tokens[0] = pending + tokens[0]
+        pending = tokens.pop() if chunk[-1] > 32 else b''
+        for token in tokens:
+            yield token
+    if pending:
+        yield pending
+
+# semitone of each note letter, by its byte value
+letter_index = {ord('c'): 0, ord('d'): 2, ord('e'): 4, ord('f'): 5, ord('g'): 7, ord('a'): 9, ord('b'): 11}
+
+def nokia_note(token):
+    """
+    Parse one nokia composer token (like b'8#g1') into (pitch, duration),
+    the pitch is a MIDI note number or "r" for a rest
+    """
+    i = 0
+    duration = 0
+    while 48 <= token[i] <= 57:
+        duration = duration * 10 + token[i] - 48
+        i += 1
+    octave = len(token) - 1
+    dotted = token[i] == 46  # '.'
+    if dotted:
+        i += 1
+    elif token[octave] == 46:
+        dotted = True
+        octave -= 1
+    if token[i] == 45:  # '-'
+        pitch = "r"
+    else:
+        sharp = token[i] == 35  # '#'
+        if sharp:
+            i += 1
+        pitch = (token[octave] - 47) * 12 + letter_index[token[i] | 0x20] + sharp
+    return pitch, -duration if dotted else duration
+
+def nokia_tune(song):
+    """
+    Parse nokia composer notes, yields the tempo first and then
+    (pitch, duration) tuples. song is a string or bytes, or an iterable
+    of chunks of them (like from_file)
+    """
+    if isinstance(song, (str, bytes, bytearray, memoryview)):
+        song = (song,)
+    for token in itokens(song):
+        if token[0] == 116:  # 't='
+            yield int(token[2:])
+            continue
+        yield nokia_note(token)
+
+
+def compile_tune(tempo, tune, transpose=0, a4=A4):
+    """
+    Compile (pitch, duration) tuples into a flat array of
+    frequency_hz, duration_ms pairs, a frequency of 0 is a rest.
+    pitch is a note name, a MIDI note number or "r" for a rest,
+    negative durations are dotted notes (like in PySynth),
+    transpose is in octaves
+    """
+    events = array('I')
+    for _ in compile_tune_steps(tempo, tune, events, transpose, a4):
+        pass
+    return events
+
+
+def compile_tune_steps(tempo, tune, events, transpose=0, a4=A4):
+    """
+    compile_tune one note at a time: appends to events and yields after
+    each note, so compiling can be spread over the waits of another song
+    """
+    # fixed point tempo, in thousandths of a bpm
+    if isinstance(tempo, int):
+        tempo *= 1000
+    else:
+        tempo = int(float(tempo) * 1000)
+    table = freq_table(a4)
+    offset = 12 * transpose
+
+    for note_pitch, note_duration in tune:
+        # 240000000 = 60 sec/min * 4 beats/whole-note * 1000 msec/sec * 1000
+        if note_duration < 0:
+            duration = 360000000 // (tempo * -note_duration)
+        else:
+            duration = 240000000 // (tempo * note_duration)
+
+        if note_pitch == "r":
+            freq = 0
+        else:
+            if not isinstance(note_pitch, int):
+                note_pitch = note_number(note_pitch)
+            freq = midi_freq(note_pitch + offset, table)
+        events.append(freq)
+        events.append(duration)
+        yield
+
+
+def compile_nokia(song, tempo=None, transpose=6, a4=A4):
+    t = nokia_tune(song)
+    if not tempo:
+        tempo = next(t)
+    return compile_tune(tempo, t, transpose=transpose, a4=a4)
+
+
+if MidiFile:
+    def compile_midi(filename, track=1, transpose=6, a4=A4):
+        """
+        Compile a MIDI track, its (pitch, ticks) notes are converted to ms
+        from their absolute tick so rounding doesn't add up
+        """
+        midi = MidiFile(filename)
+        table = freq_table(a4)
+        offset = 12 * transpose
+        events = array('I')
+        tick = 0
+        ms = 0
+        for pitch, ticks in midi.read_track(track):
+            tick += ticks
+            end = midi.tick_ms(tick)
+            events.append(0 if pitch == "r" else midi_freq(pitch + offset, table))
+            events.append(end - ms)
+            ms = end
+        return events
+
+
+# RTTTL also has 'h' for b
+rtttl_letter_index = dict(letter_index)
+rtttl_letter_index[ord('h')] = 11
+
+def compile_rtttl(tune, a4=A4, transpose=0):
+    """
+    Compile an RTTTL tune (like "name:d=4,o=5,b=140:8d,8d#,c6") into
+    frequency_hz, duration_ms pairs in one pass over the notes,
+    transpose is in octaves
+    """
+    events = array('I')
+    for _ in compile_rtttl_steps(tune, events, a4, transpose):
+        pass
+    return events
+
+
+def rtttl_header(tune):
+    """
+    Split an RTTTL tune into its name, default duration, default octave,
+    bpm and the bytes of its notes
+    """
+    if isinstance(tune, str):
+        tune = tune.encode()
+    pieces = bytes(tune).split(b':')
+    if len(pieces) != 3:
+        raise ValueError('tune should contain exactly 2 colons')
+
+    default_duration, default_octave, bpm = 4, 6, 63
+    for item in pieces[1].split(b','):
+        item = item.strip().lower()
+        if len(item) > 2 and item[1] == 61:  # '='
+            value = int(item[2:])
+            if item[0] == 100:  # 'd'
+                default_duration = value
+            elif item[0] == 111:  # 'o'
+                default_octave = value
+            elif item[0] == 98:  # 'b'
+                bpm = value
+    return pieces[0].decode(), default_duration, default_octave, bpm, pieces[2]
+
+
+def compile_rtttl_steps(tune, events, a4=A4, transpose=0):
+    """
+    compile_rtttl appending to events, yields after each note
+    """
+    name, default_duration, default_octave, bpm, notes = rtttl_header(tune)
+    table = freq_table(a4)
+    transpose += 1  # octave 0 starts at MIDI note 12
+    for token in notes.split(b','):
+        token = token.strip().lower()
+        n = len(token)
+        if not n:
+            continue
+        i = 0
+        duration = 0
+        while i < n and 48 <= token[i] <= 57:
+            duration = duration * 10 + token[i] - 48
+            i += 1
+        semitone = rtttl_letter_index.get(token[i], -1)  # 'p' is a pause
+        i += 1
+        if i < n and token[i] == 35:  # '#'
+            semitone += 1
+            i += 1
+        # the spec has the dot after the octave, some tunes have it before
+        dotted = False
+        if i < n and token[i] == 46:
+            dotted = True
+            i += 1
+        octave = default_octave
+        if i < n and 48 <= token[i] <= 57:
+            octave = token[i] - 48
+            i += 1
+        if i < n and token[i] == 46:
+            dotted = True
+
+        # 240000 = 60 sec/min * 4 beats/whole-note * 1000 msec/sec
+        msec = (360000 if dotted else 240000) // (bpm * (duration or default_duration))
+        events.append(midi_freq((octave + transpose) * 12 + semitone, table) if semitone >= 0 else 0)
+        events.append(msec)
+        yield
+
+
+class Playback(object):
+    """
+    Handle of compiled events played in the background, a timer interrupt
+    reprograms the PWM at note boundaries
+    """
+
+    def __init__(self, player, events, tick_ms):
+        self.player = player
+        self.events = events
+        self.tick_ms = tick_ms
+        self.index = 0
+        self.now = 0
+        self.next_at = 0
+        self.off_at = 0
+        self.freq = 0
+        self.sounding = False  # the tone is on, not a rest or the gap after a note
+        self.paused = False
+        self.is_playing = True
+        self.timer = None
+        # only a callback that doesn't allocate can run in the interrupt,
+        # a DeferredCallback queues there and needs schedule=True (or its
+        # dispatch/run) to be drained, nothing else drains it meanwhile
+        callback = player.callback
+        self.callback = callback if getattr(callback, 'isr_safe', False) else None
+        self._tick(None)
+        if self.is_playing:
+            try:
+                self.timer = player._start_timer(self._tick, tick_ms)
+            except Exception:
+                # no handle is returned, the first note can't be left on
+                self.is_playing = False
+                player._silence()
+                raise
+
+    def _tick(self, timer):
+        # runs in interrupt context, must not allocate
+        if self.paused or not self.is_playing:
+            return
+        now = self.now
+        if now >= self.next_at:
+            i = self.index
+            events = self.events
+            if i and self.callback is not None:
+                self.callback(self.freq or self.player.min_freq)
+            if i >= len(events):
+                self.stop()
+                return
+            freq = events[i]
+            duration = events[i + 1]
+            self.index = i + 2
+            self.freq = freq
+            # from when the note was due, not the tick that noticed it, so
+            # rounding to whole ticks doesn't add up over the song
+            start = self.next_at
+            self.off_at = start + duration * self.player.articulation // 100
+            self.next_at = start + duration
+            self.sounding = freq != 0
+            if freq:
+                self.player._set_tone(freq, 30)
+            else:
+                self.player._silence()
+        elif now >= self.off_at:
+            self.sounding = False
+            self.player._silence()
+            self.off_at = self.next_at
+        self.now = now + self.tick_ms
+
+    def stop(self):
+        self.is_playing = False
+        if self.timer is not None:
+            self.timer.deinit()
+        self.player._silence()
+
+    def pause(self):
+        self.paused = True
+        self.player._silence()
+
+    def resume(self):
+        if self.sounding:
+            self.player._set_tone(self.freq, 30)
+        self.paused = False
+
 
 # TODO use an enum?
 PLATFORM_pyboard = 1
 PLATFORM_esp = 2
+PLATFORM_rp2 = 3
+PLATFORM_null = 4
+
+# events given to a player's trace
+TRACE_SONG = 1   # name
+TRACE_TEMPO = 2  # bpm
+TRACE_NOTE = 3   # freq_hz, duration_ms
+
+# platforms without a buzzer, like the unix port or CPython
+HOST_PLATFORMS = ("linux", "darwin", "win32")
 
 class BuzzerPlayer(object):
 
-    def __init__(self, pin="X8", timer_id=1, channel_id=1, callback=None, platform=None, min_freq=None):
+    def __init__(self, pin="X8", timer_id=1, channel_id=1, callback=None, platform=None, min_freq=None,
+                 tick_timer_id=None, backend=None, trace=None):
+        """
+        trace is called as trace(kind, a, b) with TRACE_* events, like a
+        buzzer.trace.TraceRing. it is off by default and then costs one
+        test per note
+        """
 
-        if not platform:
-            platform = sys.platform
+        if backend is None:
+            if not platform:
+                platform = sys.platform
 
-        if platform == "pyboard":
-            platform = PLATFORM_pyboard
-        elif "esp" in platform:  # esp8266 / esp32
-            platform = PLATFORM_esp
-        elif platform (PLATFORM_pyboard, PLATFORM_esp):
-            pass
-        else:
-            raise NotImplementedError('unsupported platform %r' % platform)
+            if platform in (PLATFORM_pyboard, PLATFORM_esp, PLATFORM_rp2, PLATFORM_null):
+                pass
+            elif platform == "pyboard":
+                platform = PLATFORM_pyboard
+            elif "esp" in platform:  # esp8266 / esp32
+                platform = PLATFORM_esp
+            elif platform == "rp2":
+                platform = PLATFORM_rp2
+            elif platform in HOST_PLATFORMS:
+                platform = PLATFORM_null
+            else:
+                raise NotImplementedError('unsupported platform %r' % platform)
+
+            from buzzer import backends
+            if platform == PLATFORM_pyboard:
+                backend = backends.PyboardBackend(pin, timer_id, channel_id, min_freq, tick_timer_id)
+            elif platform == PLATFORM_esp:
+                backend = backends.EspBackend(pin, min_freq, tick_timer_id)
+            elif platform == PLATFORM_rp2:
+                backend = backends.Rp2Backend(pin, min_freq, tick_timer_id)
+            else:
+                backend = backends.NullBackend(min_freq)
 
         self.platform = platform
+        self.backend = backend
+        self.min_freq = backend.min_freq
+        self.articulation = backend.articulation
+        # bound once, so the hot path is a single call per note
+        self._set_tone = backend.set_tone
+        self._silence = backend.silence
+        self._sleep_us = backend.sleep_us
+        self._start_timer = backend.start_timer
+        # a backend with its own clock (e.g. a virtual one) times the notes
+        self._ticks_us = getattr(backend, 'ticks_us', ticks_us)
 
-        if platform == PLATFORM_esp:
-            from machine import PWM, Pin
-            self.min_freq = min_freq or 1_000  # ValueError: frequency must be from 1Hz to 40MHz
-            #self.min_freq = min_freq or 1  # ValueError: frequency must be from 1Hz to 40MHz
-            self.buzzer_pin = PWM(Pin(pin, Pin.OUT), freq=self.min_freq, duty=0)
-        elif platform == PLATFORM_pyboard:
-            import pyb
-            from pyb import Pin, Timer
-            self.min_freq = min_freq or 0
-            self.pyb = pyb
-            self.sound_pin = Pin(pin)
-            self.timer = Timer(timer_id, freq=10000)
-            self.channel = self.timer.channel(1, Timer.PWM, pin=self.sound_pin, pulse_width=0)
-                  
         self.callback = callback
+        self.trace = trace
+        self.file_buffer = None
 
-    def from_file(self, filename, chunksize=5):
+    def from_file(self, filename, chunksize=512, buf=None):
+        """
+        Read a file with readinto() into one buffer that is reused between
+        calls (or into buf), yields memoryview slices of it that are only
+        valid until the next one
+        """
+        if buf is None:
+            buf = self.file_buffer
+            if buf is None or len(buf) != chunksize:
+                buf = self.file_buffer = bytearray(chunksize)
+        view = memoryview(buf)
         with open(filename, "rb") as f:
             while True:
-                chunk = f.read(chunksize)
-                if chunk:
-                    for b in chunk:
-                        yield chr(b)
+                n = f.readinto(buf)
+                if n:
+                    yield view[:n]
                 else:
                     break
     
-    def play_nokia_tone(self, song, tempo=None, transpose=6, name="unkown"):
-        
-        pattern = "([0-9]*)(.*)([0-9]?)"
-        def tune(): 
-            for item in isplit(song):
-                if item.startswith('t'):
-                    _, tempo = item.split('=')
-                    yield tempo
-                    continue
-                match = re.match(pattern, item)
-                duration = match.group(1)
-                pitch = match.group(2)
-                octave = match.group(3)
-
-                if pitch == "-":
-                    pitch = "r"
-                if pitch.startswith("#"):
-                    pitch = pitch[1] + "#" + pitch[2:]
-                dotted = pitch.startswith(".")
-                duration = -int(duration) if dotted else int(duration)
-                yield (pitch + octave, int(duration))
-
-        t = tune()
+    def play_nokia_tone(self, song, tempo=None, transpose=6, name="unkown", background=False):
+        t = nokia_tune(song)
         if not tempo:
             tempo = next(t)
-        self.play_tune(tempo, t, transpose=transpose, name=name)
+        return self.play_tune(tempo, t, transpose=transpose, name=name, background=background)
+
+    def _play(self, events):
+        """
+        Start the notes of compiled events one at a time, yields twice per
+        note how many ms to wait: the sounding part and the gap after it
+        """
+        articulation = self.articulation
+        trace = self.trace
+        for i in range(0, len(events), 2):
+            freq = events[i]
+            duration = events[i + 1]
+            if trace is not None:
+                trace(TRACE_NOTE, freq, duration)
+            if freq:
+                self._set_tone(freq, 30)
+            else:
+                self._silence()
+            on = duration * articulation // 100
+            yield on
+            if on < duration:
+                self._silence()
+            yield duration - on
+            if callable(self.callback):
+                self.callback(freq or self.min_freq)
+        self._silence()
 
     def tone(self, freq, duration=0, duty=30):
-        if self.platform == PLATFORM_esp:
-            freq = int(freq)
-            if freq > 0:
-                self.buzzer_pin.freq(freq)
-                self.buzzer_pin.duty(duty)
-            time.sleep_us( int(duration * 0.9 * 1000) )
-            self.buzzer_pin.duty(0)
-            time.sleep_us(int(duration * 0.1 * 1000))
-
-        elif self.platform == PLATFORM_pyboard:
-            self.timer.freq(freq)  # change frequency for change tone
-            self.channel.pulse_width_percent(30)
-            self.pyb.delay(duration)
+        freq = int(freq)
+        if freq > 0 and duty:
+            self._set_tone(freq, duty)
+        else:
+            self._silence()
+        on = duration * self.articulation // 100
+        self._sleep_us(on * 1000)
+        if on < duration:
+            self._silence()
+            self._sleep_us((duration - on) * 1000)
 
         if callable(self.callback):
             self.callback(freq)
-            
-    def play_tune(self, tempo, tune, transpose=0, name="unknown"):
 
-        print("\n== playing '%s' ==:" % name)
-        full_notes_per_second = float(tempo) / 60 / 4
-        full_note_in_samples = SAMPLING_RATE / full_notes_per_second
+    def _trace_song(self, name, tempo=0):
+        trace = self.trace
+        if trace is not None:
+            trace(TRACE_SONG, name)
+            if tempo:
+                trace(TRACE_TEMPO, tempo)
 
-        for note_pitch, note_duration in tune:
-            duration = int(full_note_in_samples / note_duration)
+    def _trace_rtttl(self, tune):
+        # the header is only parsed again when tracing
+        if self.trace is not None:
+            name, _, _, bpm, _ = rtttl_header(tune)
+            self._trace_song(name, bpm)
 
-            if note_pitch == "r":
-                self.tone(self.min_freq, duration, 0)
-            else:
-                freq = note_freq(note_pitch)
-                if transpose: freq *= 2 ** transpose
-                print("%s " % note_pitch, end="")
-                self.tone(freq, duration, 30)
+    def play_tune(self, tempo, tune, transpose=0, name="unknown", background=False):
+        self._trace_song(name, tempo)
+        return self.play_compiled(compile_tune(tempo, tune, transpose=transpose), background=background)
+
+    def play_compiled(self, events, background=False, tick_ms=1, idle=None):
+        """
+        Play compiled events, with background=True a timer interrupt plays
+        them and a Playback handle is returned at once.
+        how late (in us) each note started is left in self.lateness.
+        idle(deadline, ticks_us) is called before each wait, to do some work
+        until the deadline of the next step on the player's ticks_us clock.
+        a callback with an idle method (like buzzer.deferred.DeferredCallback)
+        gets the same calls, and a deadline of None when the song is over
+        """
+        if background:
+            return Playback(self, events, tick_ms)
+
+        # each step is slept until an absolute deadline from the song start,
+        # so time spent between notes doesn't add up into tempo drift
+        ticks_us = self._ticks_us
+        callback_idle = getattr(self.callback, 'idle', None)
+        late = self.lateness = array('i', [0] * (len(events) // 2))
+        deadline = ticks_us()
+        step = 0
+        try:
+            for ms in self._play(events):
+                if not step & 1:
+                    late[step >> 1] = ticks_diff(ticks_us(), deadline)
+                step += 1
+                deadline = ticks_add(deadline, ms * 1000)
+                if idle is not None:
+                    idle(deadline, ticks_us)
+                if callback_idle is not None:
+                    callback_idle(deadline, ticks_us)
+                wait = ticks_diff(deadline, ticks_us())
+                if wait > 0:
+                    self._sleep_us(wait)
+        finally:
+            self._silence()
+        if callback_idle is not None:
+            callback_idle(None, ticks_us)
 
-        self.tone(self.min_freq, 0, 0)
+    def play_song_file(self, filename, background=False):
+        """
+        Play a compiled song file (see buzzer.songfile)
+        """
+        from buzzer.songfile import load
+        self._trace_song(filename)
+        return self.play_compiled(load(filename), background=background)
 
     if MidiFile:
-        def play_midi(self, filename, track=1,  transpose=6):
-            midi = MidiFile(filename)
-            tune = midi.read_track(track)
-            self.play_tune(midi.tempo, tune, transpose=transpose, name=filename)
+        def play_midi(self, filename, track=1,  transpose=6, background=False, arpeggio=0):
+            """
+            Play a MIDI track, with arpeggio (a rate in Hz) chords are played
+            by cycling through their notes instead of keeping the last one,
+            which can't be done in the background
+            """
+            if arpeggio and background:
+                raise NotImplementedError('arpeggio can only be played in the foreground')
+            self._trace_song(filename)
+            if arpeggio:
+                from buzzer.poly import compile_chords, arpeggiate
+                chords, events = compile_chords(MidiFile(filename), (track,), transpose=transpose)
+                return arpeggiate(self, chords, events, rate=arpeggio)
+            return self.play_compiled(compile_midi(filename, track=track, transpose=transpose),
+                                      background=background)
+
+    def play_rtttl(self, input, background=False):
+        self._trace_rtttl(input)
+        return self.play_compiled(compile_rtttl(input), background=background)
+
+    if asyncio:
+        async def play_compiled_async(self, events):
+            """
+            Play compiled events yielding to the event loop between notes,
+            cancelling the task silences the buzzer. the callback's idle
+            hook is called like in play_compiled
+            """
+            ticks_us = self._ticks_us
+            callback_idle = getattr(self.callback, 'idle', None)
+            late = self.lateness = array('i', [0] * (len(events) // 2))
+            deadline = ticks_us()
+            step = 0
+            try:
+                for ms in self._play(events):
+                    if not step & 1:
+                        late[step >> 1] = ticks_diff(ticks_us(), deadline)
+                    step += 1
+                    deadline = ticks_add(deadline, ms * 1000)
+                    if callback_idle is not None:
+                        callback_idle(deadline, ticks_us)
+                    await async_sleep_ms(max(0, ticks_diff(deadline, ticks_us())) // 1000)
+            finally:
+                self._silence()
+            if callback_idle is not None:
+                callback_idle(None, ticks_us)
+
+        async def play_tune_async(self, tempo, tune, transpose=0, name="unknown"):
+            self._trace_song(name, tempo)
+            await self.play_compiled_async(compile_tune(tempo, tune, transpose=transpose))
+
+        async def play_nokia_tone_async(self, song, tempo=None, transpose=6, name="unkown"):
+            t = nokia_tune(song)
+            if not tempo:
+                tempo = next(t)
+            await self.play_tune_async(tempo, t, transpose=transpose, name=name)
 
-    if RTTTL:
-        def play_rtttl(self, input):
-            tune = RTTTL(input)    
-            for freq, msec in tune.notes():
-                self.tone(freq, msec)
+        if MidiFile:
+            async def play_midi_async(self, filename, track=1, transpose=6):
+                self._trace_song(filename)
+                await self.play_compiled_async(compile_midi(filename, track=track, transpose=transpose))
 
+        async def play_rtttl_async(self, input):
+            self._trace_rtttl(input)
+            await self.play_compiled_async(compile_rtttl(input))
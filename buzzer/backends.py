@@ -0,0 +1,169 @@
+"""
+Hardware backends of BuzzerPlayer, picked once when the player is built.
+each one drives a buzzer with a set_tone(freq, duty) / silence() pair,
+duty is in percent, except on ESP where it is the raw PWM duty
+"""
+from array import array
+
+try:
+    import time
+except ImportError:
+    pass
+
+
+def machine_timer(timer_id, callback, tick_ms):
+    from machine import Timer
+    timer = Timer(timer_id)
+    timer.init(period=tick_ms, mode=Timer.PERIODIC, callback=callback)
+    return timer
+
+
+class PyboardBackend(object):
+    articulation = 100  # percent of the note that sounds
+
+    def __init__(self, pin="X8", timer_id=1, channel_id=1, min_freq=None, tick_timer_id=None):
+        import pyb
+        from pyb import Pin, Timer
+        self.min_freq = min_freq or 0
+        self.pyb = pyb
+        self.sound_pin = Pin(pin)
+        self.timer = Timer(timer_id, freq=10000)
+        self.channel = self.timer.channel(channel_id, Timer.PWM, pin=self.sound_pin, pulse_width=0)
+        self.tick_timer_id = 4 if tick_timer_id is None else tick_timer_id
+
+    def set_tone(self, freq, duty):
+        self.timer.freq(freq)
+        self.channel.pulse_width_percent(duty)
+
+    def silence(self):
+        self.channel.pulse_width_percent(0)
+
+    def sleep_us(self, us):
+        self.pyb.delay(us // 1000)
+        self.pyb.udelay(us % 1000)
+
+    def start_timer(self, callback, tick_ms):
+        timer = self.pyb.Timer(self.tick_timer_id, freq=1000 // tick_ms)
+        timer.callback(callback)
+        return timer
+
+
+class EspBackend(object):
+    articulation = 90
+
+    def __init__(self, pin, min_freq=None, tick_timer_id=None):
+        from machine import PWM, Pin
+        self.min_freq = min_freq or 1_000  # ValueError: frequency must be from 1Hz to 40MHz
+        self.buzzer_pin = PWM(Pin(pin, Pin.OUT), freq=self.min_freq, duty=0)
+        self.tick_timer_id = -1 if tick_timer_id is None else tick_timer_id
+
+    def set_tone(self, freq, duty):
+        self.buzzer_pin.freq(freq)
+        # written as is to the 0-1023 range, duty 30 is quiet on purpose
+        self.buzzer_pin.duty(duty)
+
+    def silence(self):
+        self.buzzer_pin.duty(0)
+
+    def sleep_us(self, us):
+        time.sleep_us(us)
+
+    def start_timer(self, callback, tick_ms):
+        return machine_timer(self.tick_timer_id, callback, tick_ms)
+
+
+class Rp2Backend(object):
+    articulation = 90
+
+    def __init__(self, pin, min_freq=None, tick_timer_id=None):
+        from machine import PWM, Pin
+        self.min_freq = min_freq or 0
+        self.pwm = PWM(Pin(pin))
+        self.pwm.duty_u16(0)
+        self.tick_timer_id = -1 if tick_timer_id is None else tick_timer_id
+
+    def set_tone(self, freq, duty):
+        self.pwm.freq(freq)
+        self.pwm.duty_u16(duty * 65535 // 100)
+
+    def silence(self):
+        self.pwm.duty_u16(0)
+
+    def sleep_us(self, us):
+        time.sleep_us(us)
+
+    def start_timer(self, callback, tick_ms):
+        return machine_timer(self.tick_timer_id, callback, tick_ms)
+
+
+class NullBackend(object):
+    """
+    Plays nothing and doesn't wait, for hosts without a buzzer
+    """
+    articulation = 100
+
+    def __init__(self, min_freq=None):
+        self.min_freq = min_freq or 0
+
+    def set_tone(self, freq, duty):
+        pass
+
+    def silence(self):
+        pass
+
+    def sleep_us(self, us):
+        pass
+
+    def start_timer(self, callback, tick_ms):
+        raise NotImplementedError('no timer for background playback')
+
+
+class VirtualClock(object):
+    """
+    Microsecond clock that only moves when slept on, so a song is
+    played without waiting for it
+    """
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def ticks_us(self):
+        return self.now
+
+    def sleep_us(self, us):
+        self.now += us
+
+
+class RecordingBackend(NullBackend):
+    """
+    Keeps every write as (timestamp_us, freq, duty) in an array, silence is
+    a write of freq and duty 0. time comes from a VirtualClock, several
+    backends can share one to play voices in step
+    """
+    articulation = 90
+
+    def __init__(self, min_freq=None, clock=None):
+        NullBackend.__init__(self, min_freq)
+        self.clock = clock = clock or VirtualClock()
+        self.ticks_us = clock.ticks_us
+        self.sleep_us = clock.sleep_us
+        self.log = array('I')
+
+    def set_tone(self, freq, duty):
+        log = self.log
+        log.append(self.clock.now)
+        log.append(freq)
+        log.append(duty)
+
+    def silence(self):
+        log = self.log
+        log.append(self.clock.now)
+        log.append(0)
+        log.append(0)
+
+    def writes(self):
+        """
+        The log as a list of (timestamp_us, freq, duty) tuples
+        """
+        log = self.log
+        return [(log[i], log[i + 1], log[i + 2]) for i in range(0, len(log), 3)]
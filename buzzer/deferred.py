@@ -0,0 +1,111 @@
+"""
+Player callbacks queued instead of called between notes, so a slow
+callback (like driving LEDs) doesn't delay the music
+
+    leds = DeferredCallback(blink_led)
+    buzz = BuzzerPlayer(callback=leds)
+
+played synchronously, the queue is drained in the waits of the player;
+with schedule=True it is drained through micropython.schedule;
+with asyncio, run() is a task draining it.
+background playback queues from its timer interrupt and never waits, so
+there only schedule=True, run() or calling dispatch() drain the queue
+"""
+from array import array
+
+from buzzer import asyncio, ticks_diff
+
+if asyncio:
+    from buzzer import async_sleep_ms
+
+try:
+    import micropython
+except ImportError:
+    micropython = None
+
+
+class DeferredCallback(object):
+    # queueing doesn't allocate, so background playback calls it too
+    isr_safe = True
+
+    def __init__(self, callback, size=16, schedule=False, margin_us=2000):
+        """
+        Up to size frequencies wait in a preallocated ring, the ones coming
+        when it is full are dropped and counted in overflows.
+        margin_us is how long before the next note callbacks stop being
+        run in the player's waits
+        """
+        self.callback = callback
+        self.ring = array('I', [0] * size)
+        self.head = 0
+        self.count = 0
+        self.overflows = 0
+        self.margin_us = margin_us
+        self.schedule = schedule and micropython is not None
+        self.scheduled = False
+        # bound once, micropython.schedule from an interrupt can't allocate it
+        self._scheduled_ref = self._scheduled
+
+    def __call__(self, freq):
+        ring = self.ring
+        if self.count == len(ring):
+            self.overflows += 1
+            return
+        i = self.head + self.count
+        if i >= len(ring):
+            i -= len(ring)
+        ring[i] = freq
+        self.count += 1
+        if self.schedule and not self.scheduled:
+            try:
+                micropython.schedule(self._scheduled_ref, 0)
+                self.scheduled = True
+            except RuntimeError:  # schedule queue full, next call retries
+                pass
+
+    def __len__(self):
+        return self.count
+
+    def _scheduled(self, _):
+        self.scheduled = False
+        self.dispatch()
+
+    def dispatch(self, limit=-1):
+        """
+        Run the queued callbacks oldest first, at most limit of them,
+        returns how many ran
+        """
+        ring = self.ring
+        callback = self.callback
+        n = 0
+        while self.count and n != limit:
+            freq = ring[self.head]
+            self.head += 1
+            if self.head == len(ring):
+                self.head = 0
+            self.count -= 1
+            callback(freq)
+            n += 1
+        return n
+
+    def idle(self, deadline, ticks_us):
+        """
+        Idle hook of BuzzerPlayer.play_compiled: runs callbacks while the
+        deadline of the next note on the player's ticks_us clock is more
+        than margin_us away, a deadline of None runs them all
+        """
+        if deadline is None:
+            self.dispatch()
+            return
+        margin = self.margin_us
+        while self.count and ticks_diff(deadline, ticks_us()) > margin:
+            self.dispatch(1)
+
+    if asyncio:
+        async def run(self, period_ms=20):
+            """
+            Task running the queued callbacks in batches every period_ms
+            """
+            while True:
+                self.dispatch()
+                await async_sleep_ms(period_ms)
@@ -0,0 +1,92 @@
+"""
+Songs played back to back with no gap: the next song is compiled, a note
+at a time, in the waits of the one playing
+"""
+from array import array
+
+from buzzer import compile_rtttl_steps, compile_tune_steps, nokia_tune, ticks_diff
+
+
+def compile_steps(song, events):
+    """
+    Generator compiling song into events a step at a time. song is a
+    nokia or RTTTL tune as str, bytes or memoryview (like a SongBank
+    entry), a (tempo, nokia song) tuple, or a function returning compiled
+    events (for MIDI or song files), which is one step
+    """
+    if callable(song):
+        events.extend(song())
+        return
+    tempo = None
+    if isinstance(song, tuple):
+        tempo, song = song
+    elif (song.count(':') if isinstance(song, str) else bytes(song).count(b':')) == 2:
+        yield from compile_rtttl_steps(song, events)
+        return
+    t = nokia_tune(song)
+    if not tempo:
+        tempo = next(t)
+    else:
+        # a given tempo wins over the one in the song, if it has one
+        t = (note for note in t if not isinstance(note, int))
+    yield from compile_tune_steps(tempo, t, events, transpose=6)
+
+
+class Playlist(object):
+
+    def __init__(self, player, songs=(), margin_us=2000):
+        """
+        Queue of songs for player, see compile_steps for what a song can be.
+        compiling stops margin_us before each note is due, and at most
+        one song is compiled ahead of the one playing
+        """
+        self.player = player
+        self.songs = list(songs)
+        self.margin_us = margin_us
+        self.next = None  # events of the next song, maybe half compiled
+        self._steps = None
+
+    def __len__(self):
+        return len(self.songs) + (self.next is not None)
+
+    def add(self, song):
+        self.songs.append(song)
+
+    def _prefetch(self):
+        if self.next is None and self.songs:
+            self.next = array('I')
+            self._steps = compile_steps(self.songs.pop(0), self.next)
+
+    def _idle(self, deadline, ticks_us):
+        steps = self._steps
+        if steps is None:
+            return
+        margin = self.margin_us
+        try:
+            while ticks_diff(deadline, ticks_us()) > margin:
+                next(steps)
+        except StopIteration:
+            self._steps = None
+
+    def _take(self):
+        self._prefetch()
+        events = self.next
+        if self._steps is not None:
+            # the rests were too short to compile it all, finish it now
+            for _ in self._steps:
+                pass
+            self._steps = None
+        self.next = None
+        return events
+
+    def play(self):
+        """
+        Play the songs until the queue is empty, songs added meanwhile
+        (from the player's callback) are played too
+        """
+        player = self.player
+        events = self._take()
+        while events is not None:
+            self._prefetch()
+            player.play_compiled(events, idle=self._idle)
+            events = self._take()
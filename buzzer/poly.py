@@ -0,0 +1,192 @@
+"""
+Polyphonic playback of MIDI files, on several buzzers with one voice per
+buzzer or on a single buzzer by cycling fast through the notes of chords
+"""
+from array import array
+
+import buzzer
+from buzzer import A4, TRACE_NOTE, freq_table, midi_freq, ticks_diff, ticks_add
+
+
+def compile_voices(midi, tracks, voices, transpose=6, a4=A4):
+    """
+    Merge the notes of several tracks of a MidiFile into one time sorted
+    array of (time_ms, voice, frequency_hz) events, a frequency of 0
+    silences the voice. each note takes a free voice, notes that find
+    none are dropped
+    """
+    notes = []
+    for track in tracks:
+        notes.extend(midi.read_notes(track))
+
+    # note offs sort before note ons of the same tick, freeing their voice.
+    # a note without duration would be switched off before it is on
+    changes = []
+    for i, note in enumerate(notes):
+        if not note.duration:
+            continue
+        changes.append((note.start, 1, i))
+        changes.append((note.start + note.duration, 0, i))
+    changes.sort()
+
+    table = freq_table(a4)
+    offset = 12 * transpose
+    playing = [-1] * voices    # note on each voice
+    events = array('I')
+    for tick, on, i in changes:
+        if on:
+            if -1 not in playing:
+                continue
+            voice = playing.index(-1)
+            playing[voice] = i
+            freq = midi_freq(notes[i].pitch + offset, table)
+        else:
+            if i not in playing:
+                continue
+            voice = playing.index(i)
+            playing[voice] = -1
+            freq = 0
+        events.append(midi.tick_ms(tick))
+        events.append(voice)
+        events.append(freq)
+    return events
+
+
+def compile_chords(midi, tracks, transpose=6, a4=A4):
+    """
+    Split the notes of several tracks of a MidiFile where any note starts or
+    ends, returns a chord table (a list of frequency arrays, the first one
+    empty for silence) and an array of (chord index, duration_ms) pairs
+    """
+    changes = []
+    for track in tracks:
+        for note in midi.read_notes(track):
+            changes.append((note.start, 1, note.pitch))
+            changes.append((note.start + note.duration, -1, note.pitch))
+    changes.sort()
+
+    table = freq_table(a4)
+    offset = 12 * transpose
+    chords = [array('I')]
+    index = {(): 0}
+    events = array('I')
+    held = {}   # pitch -> number of notes holding it
+    last = 0
+    for tick, change, pitch in changes:
+        if tick != last:
+            key = tuple(sorted(held))
+            chord = index.get(key)
+            if chord is None:
+                chord = index[key] = len(chords)
+                chords.append(array('I', (midi_freq(p + offset, table) for p in key)))
+            ms = midi.tick_ms(tick) - midi.tick_ms(last)
+            if events and events[-2] == chord:
+                events[-1] += ms
+            else:
+                events.append(chord)
+                events.append(ms)
+            last = tick
+        count = held.get(pitch, 0) + change
+        if count:
+            held[pitch] = count
+        else:
+            del held[pitch]
+    return chords, events
+
+
+def arpeggiate(player, chords, events, rate=50):
+    """
+    Play compiled chords on one BuzzerPlayer, switching between the notes
+    of a chord rate times a second. the player's trace and callback get
+    each chord once, with its lowest note, like a note of play_compiled
+    """
+    step = 1000000 // rate
+    ticks_us = player._ticks_us
+    callback = player.callback
+    callback_idle = getattr(callback, 'idle', None)
+    trace = player.trace
+    deadline = ticks_us()
+    try:
+        for i in range(0, len(events), 2):
+            chord = chords[events[i]]
+            ms = events[i + 1]
+            end = ticks_add(deadline, ms * 1000)
+            notes = len(chord)
+            freq = chord[0] if notes else 0
+            if trace is not None:
+                trace(TRACE_NOTE, freq, ms)
+            if notes < 2:
+                if notes:
+                    player._set_tone(freq, 30)
+                else:
+                    player._silence()
+                deadline = end
+                if callback_idle is not None:
+                    callback_idle(deadline, ticks_us)
+                wait = ticks_diff(deadline, ticks_us())
+                if wait > 0:
+                    player._sleep_us(wait)
+            else:
+                k = 0
+                while ticks_diff(end, deadline) > 0:
+                    player._set_tone(chord[k], 30)
+                    k += 1
+                    if k == notes:
+                        k = 0
+                    deadline = ticks_add(deadline, step)
+                    if ticks_diff(deadline, end) > 0:
+                        deadline = end
+                    if callback_idle is not None:
+                        callback_idle(deadline, ticks_us)
+                    wait = ticks_diff(deadline, ticks_us())
+                    if wait > 0:
+                        player._sleep_us(wait)
+            if callable(callback):
+                callback(freq or player.min_freq)
+    finally:
+        player._silence()
+    if callback_idle is not None:
+        callback_idle(None, ticks_us)
+
+
+class PolyPlayer(object):
+
+    def __init__(self, voices, duty=30):
+        """
+        voices are BuzzerPlayer objects, each on its own pin and timer
+        """
+        self.voices = voices
+        self.duty = duty
+
+    def silence(self):
+        for voice in self.voices:
+            voice._silence()
+
+    def play_compiled(self, events):
+        """
+        Play (time_ms, voice, frequency_hz) events, every change is slept
+        until its deadline from the start of the song
+        """
+        voices = self.voices
+        sleep_us = voices[0]._sleep_us
+        ticks_us = voices[0]._ticks_us
+        start = ticks_us()
+        try:
+            for i in range(0, len(events), 3):
+                wait = ticks_diff(ticks_add(start, events[i] * 1000), ticks_us())
+                if wait > 0:
+                    sleep_us(wait)
+                freq = events[i + 2]
+                if freq:
+                    voices[events[i + 1]]._set_tone(freq, self.duty)
+                else:
+                    voices[events[i + 1]]._silence()
+        finally:
+            self.silence()
+
+    if buzzer.MidiFile:
+        def play_midi(self, filename, tracks=None, transpose=6):
+            midi = buzzer.MidiFile(filename)
+            if tracks is None:
+                tracks = range(len(midi.track_chunks))
+            self.play_compiled(compile_voices(midi, tracks, len(self.voices), transpose=transpose))
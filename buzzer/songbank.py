@@ -0,0 +1,143 @@
+"""
+Song bank, many songs in one blob with an index in front, so looking up a
+song only touches that song's bytes
+
+    magic       b'BZB1'
+    count       uint16
+    entries     count times, sorted by name:
+        name offset     uint32
+        name length     uint16
+        song offset     uint32
+        song length     uint32
+    names       utf-8
+    songs       RTTTL or nokia text, or compiled songs (buzzer.songfile)
+
+All integers are little endian and offsets are from the start of the bank.
+A bank is opened from a file (memory mapped on CPython) or from a buffer,
+like a bytes constant frozen into MicroPython firmware
+"""
+import struct
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+MAGIC = b'BZB1'
+HEADER = '<4sH'
+ENTRY = '<IHII'
+HEADER_SIZE = struct.calcsize(HEADER)
+ENTRY_SIZE = struct.calcsize(ENTRY)
+
+
+def build(songs):
+    """
+    Build a bank from a dict (or (name, song) pairs) of str or bytes songs
+    """
+    if isinstance(songs, dict):
+        songs = songs.items()
+    songs = sorted((name.encode(), song.encode() if isinstance(song, str) else bytes(song))
+                   for name, song in songs)
+    names_offset = HEADER_SIZE + ENTRY_SIZE * len(songs)
+    songs_offset = names_offset + sum(len(name) for name, _ in songs)
+
+    out = bytearray(struct.pack(HEADER, MAGIC, len(songs)))
+    for name, song in songs:
+        out += struct.pack(ENTRY, names_offset, len(name), songs_offset, len(song))
+        names_offset += len(name)
+        songs_offset += len(song)
+    for name, _ in songs:
+        out += name
+    for _, song in songs:
+        out += song
+    return bytes(out)
+
+
+def write(songs, filename):
+    with open(filename, 'wb') as f:
+        f.write(build(songs))
+
+
+def write_module(songs, filename, name='BANK'):
+    """
+    Write the bank as a python module with one bytes constant, to freeze
+    into MicroPython firmware where it is used in place from flash
+    """
+    with open(filename, 'w') as f:
+        f.write('%s = %r\n' % (name, build(songs)))
+
+
+class SongBank(object):
+
+    def __init__(self, source):
+        self.file = None
+        self.map = None
+        if isinstance(source, str):
+            self.file = open(source, 'rb')
+            if mmap:
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = memoryview(source)
+        magic, self.count = struct.unpack(HEADER, self._read(0, HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError('not a song bank')
+        self.index = self._read(HEADER_SIZE, ENTRY_SIZE * self.count)
+
+    def _read(self, offset, length):
+        if self.map is not None:
+            return self.map[offset:offset + length]
+        if self.file is not None:
+            self.file.seek(offset)
+            return self.file.read(length)
+        return self.data[offset:offset + length]
+
+    def _entry(self, i):
+        return struct.unpack_from(ENTRY, self.index, i * ENTRY_SIZE)
+
+    def _name(self, i):
+        name_offset, name_length, _, _ = self._entry(i)
+        return bytes(self._read(name_offset, name_length))
+
+    def _find(self, name):
+        # binary search of the sorted index
+        name = name.encode()
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._name(lo) == name:
+            return lo
+        return -1
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, name):
+        return self._find(name) >= 0
+
+    def __getitem__(self, name):
+        i = self._find(name)
+        if i < 0:
+            raise KeyError(name)
+        _, _, song_offset, song_length = self._entry(i)
+        return self._read(song_offset, song_length)
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+    def names(self):
+        for i in range(self.count):
+            yield self._name(i).decode()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,82 @@
+"""
+Compiled song files, so a device plays a song without parsing text or MIDI
+
+All numbers are unsigned varints (7 bits per byte, least significant group
+first, high bit set on all but the last byte):
+
+    magic       b'BUZ1'
+    a4          reference pitch the notes were compiled against, in Hz
+    count       number of notes
+    notes       count times:
+        note        MIDI note number + 1, 0 for a rest
+        duration    in ms
+
+Notes above the 128 entry table are octaves of it, like buzzer.midi_freq()
+"""
+from array import array
+
+from buzzer import A4, freq_table, freq_note, midi_freq
+
+MAGIC = b'BUZ1'
+
+
+def write_varint(out, num):
+    while num > 0x7F:
+        out.append((num & 0x7F) | 0x80)
+        num >>= 7
+    out.append(num)
+
+
+def read_varint(data, pos):
+    num = 0
+    shift = 0
+    while True:
+        c = data[pos]
+        pos += 1
+        num |= (c & 0x7F) << shift
+        if not c & 0x80:
+            return num, pos
+        shift += 7
+
+
+def dumps(events, a4=A4):
+    """
+    Encode compiled (frequency_hz, duration_ms) events
+    """
+    table = freq_table(a4)
+    out = bytearray(MAGIC)
+    write_varint(out, a4)
+    write_varint(out, len(events) // 2)
+    for i in range(0, len(events), 2):
+        freq = events[i]
+        write_varint(out, freq_note(freq, table) + 1 if freq else 0)
+        write_varint(out, events[i + 1])
+    return bytes(out)
+
+
+def loads(data):
+    """
+    Decode a compiled song back to (frequency_hz, duration_ms) events
+    """
+    if data[:4] != MAGIC:
+        raise ValueError('not a compiled song')
+    a4, pos = read_varint(data, 4)
+    count, pos = read_varint(data, pos)
+    table = freq_table(a4)
+    events = array('I')
+    for _ in range(count):
+        note, pos = read_varint(data, pos)
+        duration, pos = read_varint(data, pos)
+        events.append(midi_freq(note - 1, table) if note else 0)
+        events.append(duration)
+    return events
+
+
+def dump(events, filename, a4=A4):
+    with open(filename, 'wb') as f:
+        f.write(dumps(events, a4))
+
+
+def load(filename):
+    with open(filename, 'rb') as f:
+        return loads(f.read())
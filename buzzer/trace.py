@@ -0,0 +1,73 @@
+"""
+Trace of what a BuzzerPlayer plays, kept in a ring instead of printed,
+so nothing is formatted or written out while notes are timed
+
+    ring = TraceRing()
+    buzz = BuzzerPlayer(trace=ring)
+    buzz.play_rtttl(song)
+    ring.dump()
+"""
+from buzzer import TRACE_SONG as SONG, TRACE_TEMPO as TEMPO, TRACE_NOTE as NOTE
+
+kind_names = {SONG: 'song', TEMPO: 'tempo', NOTE: 'note'}
+
+
+class TraceRing(object):
+
+    def __init__(self, size=64):
+        """
+        Keeps the last size events, older ones are overwritten and counted
+        in dropped
+        """
+        self.size = size
+        self.ring = [0] * (3 * size)  # kind, a, b of each event
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+
+    def __call__(self, kind, a, b=0):
+        ring = self.ring
+        i = self.head
+        ring[i] = kind
+        ring[i + 1] = a
+        ring[i + 2] = b
+        i += 3
+        self.head = 0 if i == len(ring) else i
+        if self.count == self.size:
+            self.dropped += 1
+        else:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def events(self):
+        """
+        The (kind, a, b) events kept, oldest first
+        """
+        ring = self.ring
+        i = self.head - 3 * self.count
+        if i < 0:
+            i += len(ring)
+        events = []
+        for _ in range(self.count):
+            events.append((ring[i], ring[i + 1], ring[i + 2]))
+            i += 3
+            if i == len(ring):
+                i = 0
+        return events
+
+    def clear(self):
+        self.head = self.count = self.dropped = 0
+
+    def dump(self, write=print):
+        """
+        Format the events kept, once playing is over
+        """
+        if self.dropped:
+            write('(%d older events dropped)' % self.dropped)
+        for kind, a, b in self.events():
+            if kind == NOTE:
+                write('note %d Hz %d ms' % (a, b))
+            else:
+                write('%s %s' % (kind_names.get(kind, kind), a))
@@ -0,0 +1,71 @@
+"""
+Render what a BuzzerPlayer plays into a square wave WAV file, on the host
+only (needs NumPy). notes are timed by a virtual clock, so a song renders
+as fast as its samples can be computed
+
+    from buzzer import BuzzerPlayer, compile_nokia
+    from buzzer.wav import WavBackend
+
+    backend = WavBackend()
+    BuzzerPlayer(backend=backend).play_compiled(compile_nokia(song))
+    backend.write('song.wav')
+"""
+import wave
+
+import numpy as np
+
+from buzzer.backends import RecordingBackend
+
+RATE = 22050
+
+
+class WavBackend(RecordingBackend):
+    """
+    Recording backend whose log of (timestamp_us, freq, duty) writes is
+    turned into 16 bit mono PCM, each tone a square wave of its duty
+    """
+
+    def __init__(self, rate=RATE, volume=0.5, min_freq=None, clock=None):
+        RecordingBackend.__init__(self, min_freq, clock)
+        self.rate = rate
+        self.volume = volume
+
+    def render(self):
+        """
+        The samples of everything written so far, as an int16 array
+        """
+        rate = self.rate
+        writes = np.asarray(self.log, dtype=np.int64).reshape(-1, 3)
+        if not len(writes):
+            return np.zeros(0, dtype=np.int16)
+        times, freqs, duties = writes[:, 0], writes[:, 1], writes[:, 2]
+        starts = times * rate // 1000000
+        # each write lasts until the next one, the last one ends the song
+        counts = np.diff(np.append(starts, starts[-1]))
+        segment = np.repeat(np.arange(len(starts)), counts)
+        offset = np.arange(starts[-1]) - starts[segment]
+        # position in the period of the tone, in 1/rate of a cycle
+        phase = offset * freqs[segment] % rate
+        duty = duties[segment]
+        level = int(32767 * self.volume)
+        samples = np.where(phase * 100 < duty * rate, level, -level)
+        return np.where(duty > 0, samples, 0).astype(np.int16)
+
+    def write(self, filename):
+        samples = self.render()
+        with wave.open(filename, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.rate)
+            f.writeframes(samples.astype('<i2').tobytes())
+        return len(samples)
+
+
+def write_wav(events, filename, rate=RATE, volume=0.5):
+    """
+    Render compiled events into filename, returns the number of samples
+    """
+    from buzzer import BuzzerPlayer
+    backend = WavBackend(rate, volume)
+    BuzzerPlayer(backend=backend).play_compiled(events)
+    return backend.write(filename)
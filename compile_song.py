@@ -0,0 +1,55 @@
+#
+# Compile songs on the host into the binary format of buzzer.songfile, so
+# devices only read the compiled file and never parse text or MIDI.
+#
+#   python3 compile_song.py star_wars.nokia star_wars.buz
+#   python3 compile_song.py song.mid song.buz --track 2
+#   python3 compile_song.py songs.rtttl entertainer.buz
+#   python3 compile_song.py star_wars.nokia --wav star_wars.wav
+#
+# MIDI input needs midi.py importable (it is in test/), --wav needs NumPy
+#
+import argparse
+import os
+
+import buzzer
+from buzzer import songfile
+
+
+def compile_file(filename, track=1, transpose=None, a4=buzzer.A4):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.mid', '.midi'):
+        if not hasattr(buzzer, 'compile_midi'):
+            raise SystemExit('midi.py is needed to compile MIDI files')
+        return buzzer.compile_midi(filename, track=track, transpose=6 if transpose is None else transpose, a4=a4)
+
+    with open(filename) as f:
+        text = f.read().strip()
+    if ext == '.rtttl' or text.count(':') == 2:
+        return buzzer.compile_rtttl(text, a4=a4, transpose=transpose or 0)
+    return buzzer.compile_nokia(text, transpose=6 if transpose is None else transpose, a4=a4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile a song for buzzer.songfile')
+    parser.add_argument('input', help='.nokia, .rtttl or .mid file')
+    parser.add_argument('output', nargs='?', help='compiled song, defaults to the input with a .buz extension')
+    parser.add_argument('--track', type=int, default=1, help='MIDI track to compile')
+    parser.add_argument('--transpose', type=int, default=None, help='octaves to transpose the notes (default 6 for nokia and MIDI, 0 for RTTTL)')
+    parser.add_argument('--a4', type=int, default=buzzer.A4, help='reference pitch in Hz')
+    parser.add_argument('--wav', help='render the song into this WAV file instead, to listen to it')
+    args = parser.parse_args()
+
+    events = compile_file(args.input, track=args.track, transpose=args.transpose, a4=args.a4)
+    if args.wav:
+        from buzzer.wav import write_wav
+        samples = write_wav(events, args.wav)
+        print('%s: %d notes, %d samples' % (args.wav, len(events) // 2, samples))
+        return
+    output = args.output or os.path.splitext(args.input)[0] + '.buz'
+    songfile.dump(events, output, a4=args.a4)
+    print('%s: %d notes, %d bytes' % (output, len(events) // 2, os.path.getsize(output)))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ import logging
 from pyb import Timer, Pin
 
 from buzzer import BuzzerPlayer, songs
+from buzzer.deferred import DeferredCallback
+from buzzer.playlist import Playlist
 
 
 logger = logging.getLogger(__name__)
@@ -95,15 +97,21 @@ if __name__ == "__main__":
         if m == 2: rgb.blue(val); rgb.red(0); rgb.green(0)
         if m == 3: rgb.green(val); rgb.red(0); rgb.blue(0)
 
-    buzz = BuzzerPlayer(callback=blink_led)
+    # the LEDs are updated in the waits between notes, so they can't delay them
+    leds = DeferredCallback(blink_led)
+    buzz = BuzzerPlayer(callback=leds)
+    # each song is compiled while the one before it plays, so there's no gap
+    playlist = Playlist(buzz)
 
     try:
         while True:
             for song_name, v in songs.items():
-                tempo, song = v
-                buzz.play_nokia_tone(tempo=tempo, song=song, name=song_name)
+                playlist.add(v)
+            playlist.play()
     finally:
-        buzz.channel.pulse_width_percent(0)
+        buzz.backend.silence()
         rgb.off()
+        if leds.overflows:
+            logger.debug('%d LED updates dropped', leds.overflows)
 
 
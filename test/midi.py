@@ -29,32 +29,30 @@ class Note(object):
         return self.start + self.duration
 
 
+def read_variable_length(data, pos):
+    """
+    Decode the variable length quantity at data[pos], returns it and the
+    position after it
+    """
+    num = 0
+    while True:
+        c = data[pos]
+        pos += 1
+        num = (num << 7) | (c & 0x7F)
+        if not c & 0x80:
+            return num, pos
+
+
 class MidiFile(object):
     """
     Represents the notes in a MIDI file
     """
 
-    @staticmethod
-    def read_byte(file):
-        return struct.unpack('B', file.read(1))[0]
-    
-    def read_variable_length(self, file, counter):
-        counter -= 1
-        num = self.read_byte(file)
-        
-        if num & 0x80:
-            num = num & 0x7F
-            while True:
-                counter -= 1
-                c = self.read_byte(file)
-                num = (num << 7) + (c & 0x7F)
-                if not (c & 0x80):
-                    break
-        
-        return num, counter
-    
     def __init__(self, file_name):
         self.tempo = 120
+        self.us_per_quarter = 500000
+        # (tick, us per quarter note, us at that tick) of each tempo change
+        self.tempo_map = [(0, 500000, 0)]
         self.file_name = file_name
         file = None
         try:
@@ -62,148 +60,195 @@ class MidiFile(object):
             if file.read(4) != b'MThd': raise Exception('Not a MIDI file')
             size = struct.unpack('>i', file.read(4))[0]
             if size != 6: raise Exception('Unusual MIDI file with non-6 sized header')
-            self.format = struct.unpack('>h', file.read(2))[0]
-            self.track_count = struct.unpack('>h', file.read(2))[0]
-            self.time_division = struct.unpack('>h', file.read(2))[0]
+            self.format, self.track_count, self.time_division = struct.unpack('>hhh', file.read(6))
+
+            # (offset, length) of each MTrk chunk, other chunks are skipped
+            self.track_chunks = []
+            offset = 8 + size
+            while True:
+                file.seek(offset)
+                header = file.read(8)
+                if len(header) < 8:
+                    break
+                length = struct.unpack('>i', header[4:])[0]
+                if header[:4] == b'MTrk':
+                    self.track_chunks.append((offset + 8, length))
+                offset += 8 + length
         finally:
             if file:
                 file.close()
 
+    def read_chunk(self, file, track_num):
+        offset, length = self.track_chunks[track_num]
+        file.seek(offset)
+        return file.read(length)
+
     def read_track(self, track_num=1):
+        return self.parse_into_song(self.read_notes(track_num))
+
+    def read_notes(self, track_num=1):
+        """
+        The notes of a track, with their start and duration in ticks
+        """
         file = None
         try:
             file = open(self.file_name, 'rb')
-            if file.read(4) != b'MThd': raise Exception('Not a MIDI file')
-            size = struct.unpack('>i', file.read(4))[0]
-            if size != 6: raise Exception('Unusual MIDI file with non-6 sized header')
-            self.format = struct.unpack('>h', file.read(2))[0]
-            self.track_count = struct.unpack('>h', file.read(2))[0]
-            self.time_division = struct.unpack('>h', file.read(2))[0]
-
-            # Now to fill out the arrays with the notes
-            tracks = []
-            for i in range(0, self.track_count):
-                tracks.append([])
-
-            for nn, track in enumerate(tracks):
-                abs_time = 0.
-
-                if file.read(4) != b'MTrk': raise Exception('Not a valid track')
-                size = struct.unpack('>i', file.read(4))[0]
-
-                # To keep track of running status
-                last_flag = None
-                while size > 0:
-                    delta, size = self.read_variable_length(file, size)
-                    delta /= float(self.time_division)
-                    abs_time += delta
-
-                    size -= 1
-                    flag = self.read_byte(file)
-                    # Sysex messages
-                    if flag == 0xF0 or flag == 0xF7:
-                        # print "Sysex"
-                        while True:
-                            size -= 1
-                            if self.read_byte(file) == 0xF7: break
-                    # Meta messages
-                    elif flag == 0xFF:
-                        size -= 1
-                        type = self.read_byte(file)
-                        if type == 0x2F:    # end of track event
-                            self.read_byte(file)
-                            size -= 1
-                            break
-                        logger.debug("Meta: %s", str(type))
-                        length, size = self.read_variable_length(file, size)
-                        message = file.read(length)
-                        # if type not in [0x0, 0x7, 0x20, 0x2F, 0x51, 0x54, 0x58, 0x59, 0x7F]:
-                        logger.debug("%s %s", length, message)
-                        if type == 0x51:    # qpm/bpm
-                            # http://www.recordingblogs.com/sa/Wiki?topic=MIDI+Set+Tempo+meta+message
-                            self.tempo = 6e7 / struct.unpack('>i', b'\x00' + message)[0]
-                            logger.debug("tempo = %sbpm", self.tempo)
-                    # MIDI messages
-                    else:
-                        if flag & 0x80:
-                            type_and_channel = flag
-                            size -= 1
-                            param1 = self.read_byte(file)
-                            last_flag = flag
-                        else:
-                            type_and_channel = last_flag
-                            param1 = flag
-                        type = ((type_and_channel & 0xF0) >> 4)
-                        channel = type_and_channel & 0xF
-                        if type == 0xC: # detect MIDI program change
-                            logger.debug("program change, channel %s = %s", channel, param1)
-                            continue
-                        size -= 1
-                        param2 = self.read_byte(file)
-                        
-                        # detect MIDI ons and MIDI offs
-                        if type == 0x9:
-                            note = Note(channel, param1, param2, abs_time)
-                            if nn == track_num:
-                                logger.debug("%s", note)
-                                track.append(note)
-
-                        elif type == 0x8:
-                            for note in reversed(track):
-                                if note.channel == channel and note.pitch == param1:
-                                    note.duration = abs_time - note.start
-                                    break
-
+            self.tempo_map = []
+            # the tempo of format 1 files is in the first track
+            if track_num != 0:
+                self.parse_track(self.read_chunk(file, 0))
+            track = []
+            self.parse_track(self.read_chunk(file, track_num), track)
         finally:
-            if file: 
+            if file:
                 file.close()
-    
-        return self.parse_into_song(tracks[track_num])
+
+        self.build_tempo_map()
+        return track
+
+    def parse_track(self, data, track=None):
+        """
+        Decode the events of one MTrk chunk, notes are appended to track
+        (when given), tempo changes are collected from any track
+        """
+        abs_time = 0
+        pos = 0
+        end = len(data)
+        # To keep track of running status
+        last_flag = None
+        # sounding notes by channel and pitch, to pair them with their NOTE OFF
+        active = {}
+        # tick each key was last retriggered at, its NOTE OFF may still come
+        retriggered = {}
+        while pos < end:
+            delta, pos = read_variable_length(data, pos)
+            abs_time += delta
+
+            flag = data[pos]
+            pos += 1
+            # Sysex messages, skipped
+            if flag == 0xF0 or flag == 0xF7:
+                length, pos = read_variable_length(data, pos)
+                pos += length
+            # Meta messages
+            elif flag == 0xFF:
+                type = data[pos]
+                if type == 0x2F:    # end of track event
+                    break
+                length, pos = read_variable_length(data, pos + 1)
+                logger.debug("Meta: %s %s", type, length)
+                if type == 0x51:    # qpm/bpm
+                    # http://www.recordingblogs.com/sa/Wiki?topic=MIDI+Set+Tempo+meta+message
+                    self.us_per_quarter = (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]
+                    self.tempo = 6e7 / self.us_per_quarter
+                    self.tempo_map.append((abs_time, self.us_per_quarter))
+                    logger.debug("tempo = %sbpm", self.tempo)
+                pos += length
+            # MIDI messages
+            else:
+                if flag & 0x80:
+                    type_and_channel = flag
+                    param1 = data[pos]
+                    pos += 1
+                    last_flag = flag
+                else:
+                    type_and_channel = last_flag
+                    param1 = flag
+                type = type_and_channel >> 4
+                channel = type_and_channel & 0xF
+                if type == 0xC or type == 0xD:  # program change / channel pressure
+                    logger.debug("program change, channel %s = %s", channel, param1)
+                    continue
+                param2 = data[pos]
+                pos += 1
+
+                if track is None:
+                    continue
+                # detect MIDI ons and MIDI offs, a NOTE ON with velocity 0 is a NOTE OFF
+                if type == 0x9 and param2:
+                    note = Note(channel, param1, param2, abs_time)
+                    logger.debug("%s", note)
+                    track.append(note)
+                    # a retriggered note ends the one still sounding
+                    note = active.get((channel << 7) | param1)
+                    if note is not None:
+                        note.duration = abs_time - note.start
+                        retriggered[(channel << 7) | param1] = abs_time
+                    active[(channel << 7) | param1] = track[-1]
+
+                elif type == 0x8 or type == 0x9:
+                    key = (channel << 7) | param1
+                    note = active.get(key)
+                    if note is None:
+                        continue
+                    # the first NOTE OFF at the tick of a retrigger belongs
+                    # to the note that was retriggered there
+                    if retriggered.get(key) == abs_time:
+                        del retriggered[key]
+                        continue
+                    note.duration = abs_time - note.start
+                    del active[key]
+
+        # notes that never got a NOTE OFF last until the end of the track
+        for note in active.values():
+            note.duration = abs_time - note.start
 
     def parse_into_song(self, track):
-        notes = {}
+        """
+        Flatten notes into a monophonic list of (pitch, duration) where the
+        pitch is a MIDI note number or 'r' for a rest, durations in ticks
+        """
         song = []
         last2 = 0
-
-        def getnote(q):
-            for x in q.keys():
-                if q[x] > 0:
-                    return x
-            return None
-    
-        for nn in track:
-            nn = str(nn).split()
-            start, stop = float(nn[2]), float(nn[3])
-    
-            if start != stop:   # note ends because of NOTE OFF event
-                if last2 > -1 and start - last2 > 0:
-                    song.append(('r', getdur(last2, start)))
-                song.append((nn[0].lower(), getdur(start, stop)))
-                last2 = stop
-            elif float(nn[1]) == 0 and notes.get(nn[0].lower(), -1) >= 0: # note ends because of NOTE ON with velocity = 0
-                if last2 > -1 and notes[nn[0].lower()] - last2 > 0:
-                    song.append(('r', getdur(last2, notes[nn[0].lower()])))
-                song.append((nn[0].lower(), getdur(notes[nn[0].lower()], start)))
-                notes[nn[0].lower()] = -1
-                last2 = start
-            elif float(nn[1]) > 0 and notes.get(nn[0].lower(), -1) == -1: # note ends because of new note
-                old = getnote(notes)
-                if old != None:
-                    if notes[old] != start:
-                        song.append((old, getdur(notes[old], start)))
-                    notes[old] = -1
-                elif start - last2 > 0:
-                    song.append(('r', getdur(last2, start)))
-                notes[nn[0].lower()] = start
-                last2 = start
-
-        return song    
-
-
-def getdur(a, b):
-    """
-    Calculate note length for PySynth"
-    """
-
-    return 4 / (b - a)
-
+        last_start = 0
+
+        for note in track:
+            if not note.duration:
+                # switched off on the tick it started, nothing to play
+                continue
+            pitch = note.pitch
+            start = note.start
+            stop = start + note.duration
+
+            if start > last2:
+                song.append(('r', start - last2))
+            elif start < last2 and song:
+                # overlaps the note before it, which is cut short
+                if start > last_start:
+                    song[-1] = (song[-1][0], start - last_start)
+                else:
+                    song.pop()
+            song.append((pitch, stop - start))
+            last_start = start
+            last2 = stop
+
+        return song
+
+    def build_tempo_map(self):
+        """
+        Sort the collected (tick, us per quarter note) tempo changes and add
+        the time in us each one starts at
+        """
+        changes = sorted(self.tempo_map)
+        if not changes or changes[0][0] != 0:
+            changes.insert(0, (0, 500000))
+        tempo_map = []
+        last_tick, last_tempo, us = 0, changes[0][1], 0
+        for change in changes:
+            tick, tempo = change[0], change[1]
+            us += (tick - last_tick) * last_tempo // self.time_division
+            if tempo_map and tempo_map[-1][0] == tick:
+                tempo_map.pop()
+            tempo_map.append((tick, tempo, us))
+            last_tick, last_tempo = tick, tempo
+        self.tempo_map = tempo_map
+
+    def tick_ms(self, tick):
+        """
+        Time in ms of an absolute tick, following the tempo map
+        """
+        i = len(self.tempo_map) - 1
+        while self.tempo_map[i][0] > tick:
+            i -= 1
+        start, tempo, us = self.tempo_map[i]
+        return (us + (tick - start) * tempo // self.time_division) // 1000
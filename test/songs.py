@@ -35,8 +35,57 @@ SONGS = [
 ]
 
 
-def find(name):
+# built on the first lookup: a dict by exact name, and the lowercased names
+# sorted for binary search, with the song each one belongs to
+_by_name = None
+_keys = None
+_sorted_songs = None
+
+
+def _build_index():
+    global _by_name, _keys, _sorted_songs
+    by_name = {}
+    keyed = []
     for song in SONGS:
-        song_name = song.split(':')[0]
-        if song_name == name:
-            return song
+        name = song[:song.index(':')]
+        by_name[name] = song
+        keyed.append((name.lower(), song))
+    keyed.sort()
+    _keys = [key for key, _ in keyed]
+    _sorted_songs = [song for _, song in keyed]
+    _by_name = by_name
+
+
+def _bisect(key):
+    lo, hi = 0, len(_keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _keys[mid] < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def find(name, ignore_case=False):
+    if _by_name is None:
+        _build_index()
+    if not ignore_case:
+        return _by_name.get(name)
+    key = name.lower()
+    i = _bisect(key)
+    if i < len(_keys) and _keys[i] == key:
+        return _sorted_songs[i]
+
+
+def find_prefix(prefix):
+    """
+    Songs whose name starts with prefix (ignoring case), sorted by name
+    """
+    if _by_name is None:
+        _build_index()
+    prefix = prefix.lower()
+    i = _bisect(prefix)
+    while i < len(_keys) and _keys[i].startswith(prefix):
+        yield _sorted_songs[i]
+        i += 1
@@ -1,9 +1,16 @@
 import os.path
 import unittest
 
-from buzzer import BuzzerPlayer, note_freq
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+import buzzer
+from buzzer import BuzzerPlayer, note_freq, compile_nokia, compile_tune, freq_table, midi_freq, note_number, itokens, nokia_tune
 from nokia_songs import songs as nokia_songs
 import songs
+from buzzer import songfile, songbank
 
 #import logging
 #logger = logging.getLogger(__name__)
@@ -27,6 +34,23 @@ class BuzzerTests(unittest.TestCase):
         for key, val in PITCHHZ.items():
             self.assertAlmostEqual(note_freq(key),  val, delta=2)
 
+    def test_00_freq_table(self):
+        table = freq_table(440)
+        self.assertEqual(len(table), 128)
+        self.assertTrue(table is freq_table(440))
+        self.assertEqual(table[69], 440)
+        self.assertEqual(freq_table(432)[69], 432)
+        self.assertEqual(note_number('a4'), 69)
+        self.assertEqual(note_number('c#2'), 37)
+
+    def test_00_transpose_offset(self):
+        table = freq_table()
+        for note in ('c1', 'e1', 'a#2', 'b3', 'g7'):
+            for transpose in (0, 1, 3, 6):
+                expected = note_freq(note) * 2 ** transpose
+                self.assertAlmostEqual(midi_freq(note_number(note) + 12 * transpose, table),
+                                       expected, delta=2 ** transpose)
+
     @staticmethod
     def test_01_init_no_params():
         b = BuzzerPlayer()
@@ -68,6 +92,503 @@ class BuzzerTests(unittest.TestCase):
         if hasattr(buzz, 'play_rtttl'):
             buzz.play_rtttl(songs.find('Entertainer'))
 
+    def test_06_compile_nokia(self):
+        events = compile_nokia(nokia_songs['imperial_march'])
+        self.assertEqual(len(events), 2 * 24)
+        # 4e1 at t=100 transposed 6 octaves: quarter note of 600ms
+        self.assertEqual(events[0], midi_freq(note_number('e1') + 12 * 6, freq_table()))
+        self.assertEqual(events[1], 600)
+        # 16- is a rest
+        self.assertEqual(events[8], 0)
+        self.assertEqual(events[9], 150)
+
+    def test_06_compile_nokia_dotted(self):
+        events = compile_nokia("t=100 4.e1 4e1", transpose=0)
+        self.assertEqual(tuple(events), (note_freq('e1'), 900, note_freq('e1'), 600))
+
+    def test_07_play_compiled(self):
+        played = []
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard', callback=played.append)
+        events = compile_nokia(nokia_songs['imperial_march'])
+        buzz.play_compiled(events)
+        self.assertEqual(played, [events[i] for i in range(0, len(events), 2)])
+
+    def test_07_compile_midi_and_rtttl(self):
+        if hasattr(buzzer, 'compile_midi'):
+            events = buzzer.compile_midi(self.sample_file, track=1)
+            self.assertTrue(len(events) > 0)
+            self.assertEqual(len(events) % 2, 0)
+        events = buzzer.compile_rtttl(songs.find('Entertainer'))
+        self.assertEqual(events[0], 587)
+        self.assertEqual(events[1], 214)
+
+    def test_08_play_background(self):
+        for platform in ('pyboard', 'esp8266'):
+            buzz = BuzzerPlayer(1, 2, 4, platform=platform)
+            events = compile_nokia(nokia_songs['imperial_march'])
+            handle = buzz.play_nokia_tone(nokia_songs['imperial_march'], background=True)
+            self.assertTrue(handle.is_playing)
+            ticks = 0
+            while handle.is_playing:
+                handle._tick(None)
+                ticks += 1
+            self.assertEqual(ticks, sum(events[i] for i in range(1, len(events), 2)))
+
+    def test_08_background_stop_pause(self):
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard')
+        handle = buzz.play_compiled(compile_nokia(nokia_songs['imperial_march']), background=True, tick_ms=10)
+        handle._tick(None)
+        handle.pause()
+        index, now = handle.index, handle.now
+        handle._tick(None)
+        self.assertEqual((handle.index, handle.now), (index, now))
+        handle.resume()
+        handle._tick(None)
+        self.assertEqual(handle.now, now + 10)
+        handle.stop()
+        self.assertFalse(handle.is_playing)
+        handle._tick(None)
+        self.assertEqual(handle.now, now + 10)
+
+    def test_08_background_tick_rounding(self):
+        log = []
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard')
+        buzz._set_tone = lambda freq, duty: log.append(handle.now if log else 0)
+        handle = None
+        handle = buzz.play_compiled(buzzer.array('I', (440, 214) * 10), background=True, tick_ms=10)
+        while handle.is_playing:
+            handle._tick(None)
+        # each note starts on the first tick after it is due, 214 ms apart
+        self.assertEqual(log, [0, 220, 430, 650, 860, 1070, 1290, 1500, 1720, 1930])
+        self.assertEqual(handle.now, 2140)
+
+    def test_08_background_resume_in_gap(self):
+        log = []
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard')
+        buzz._set_tone = lambda freq, duty: log.append((freq, duty))
+        buzz._silence = lambda: log.append(0)
+        buzz.articulation = 90
+        handle = buzz.play_compiled(buzzer.array('I', (440, 100, 880, 100)), background=True, tick_ms=5)
+        while handle.now < 95:
+            handle._tick(None)
+        self.assertEqual(log, [(440, 30), 0])
+        # paused and resumed in the gap after the note, it stays silent
+        handle.pause()
+        handle.resume()
+        self.assertEqual(log, [(440, 30), 0, 0])
+        handle._tick(None)
+        handle._tick(None)
+        self.assertEqual(log, [(440, 30), 0, 0, (880, 30)])
+
+    def test_09_play_async(self):
+        played = []
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard', callback=played.append)
+        if hasattr(buzz, 'play_nokia_tone_async'):
+            song = "t=200 32c1 32- 32d1"
+            asyncio.run(buzz.play_nokia_tone_async(song))
+            events = compile_nokia(song)
+            self.assertEqual(played, [events[0], 0, events[4]])
+
+            from buzzer.deferred import DeferredCallback
+            del played[:]
+            buzz.callback = deferred = DeferredCallback(played.append)
+            asyncio.run(buzz.play_nokia_tone_async(song))
+            self.assertEqual(played, [events[0], 0, events[4]])
+            self.assertEqual(len(deferred), 0)
+
+    def test_09_play_async_cancel(self):
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard')
+        if not hasattr(buzz, 'play_compiled_async'):
+            return
+        silenced = []
+        buzz._silence = lambda: silenced.append(True)
+
+        async def main():
+            task = asyncio.create_task(buzz.play_compiled_async(compile_nokia("t=60 1c1 1d1")))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(main())
+        self.assertEqual(silenced, [True])
+
+    def test_10_deadline_scheduling(self):
+        from buzzer.backends import RecordingBackend
+        recorder = RecordingBackend()
+        clock = recorder.clock
+
+        def slow_callback(freq):
+            clock.now += 3000
+
+        buzz = BuzzerPlayer(callback=slow_callback, backend=recorder)
+        events = compile_nokia(nokia_songs['imperial_march'])
+        buzz.play_compiled(events)
+        total = sum(events[i] for i in range(1, len(events), 2)) * 1000
+        # the callback overhead doesn't accumulate, only the last one is added
+        self.assertEqual(clock.now, total + 3000)
+        self.assertEqual(len(buzz.lateness), len(events) // 2)
+        self.assertEqual(tuple(buzz.lateness), (0,) + (3000,) * (len(events) // 2 - 1))
+
+    def test_11_itokens(self):
+        chunks = (b't=1', bytearray(b'00 8#g1'), memoryview(b' 2a1  \n'), '16- 4', b'.e2')
+        self.assertEqual([bytes(t) for t in itokens(chunks)], [b't=100', b'8#g1', b'2a1', b'16-', b'4.e2'])
+        self.assertEqual(list(itokens((b'  ', b'', b'4e1', b' ', b'4e1 '))), [b'4e1', b'4e1'])
+
+    def test_11_nokia_tune(self):
+        self.assertEqual(list(nokia_tune("t=100 8#g1 2A1 16- 4.e2 4e2.")),
+                         [100, (32, 8), (33, 2), ('r', 16), (40, -4), (40, -4)])
+
+    def test_11_nokia_file_chunks(self):
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard')
+        with open(self.nokia_file) as f:
+            expected = compile_nokia(f.read())
+        for chunksize in (1, 3, 64, 4096):
+            self.assertEqual(compile_nokia(buzz.from_file(self.nokia_file, chunksize)), expected)
+
+    def test_12_from_file_buffer(self):
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard')
+        with open(self.nokia_file, 'rb') as f:
+            content = f.read()
+        chunks = [bytes(c) for c in buzz.from_file(self.nokia_file)]
+        self.assertEqual(b''.join(chunks), content)
+        self.assertEqual(len(chunks), (len(content) + 511) // 512)
+        buf = buzz.file_buffer
+        list(buzz.from_file(self.nokia_file))
+        self.assertTrue(buzz.file_buffer is buf)
+        own = bytearray(100)
+        self.assertEqual(b''.join(bytes(c) for c in buzz.from_file(self.nokia_file, buf=own)), content)
+        self.assertTrue(buzz.file_buffer is buf)
+
+    def test_13_compile_midi_tempo_change(self):
+        if hasattr(buzzer, 'compile_midi'):
+            midi_file = os.path.join(os.path.dirname(__file__), 'tempo_change.mid')
+            events = buzzer.compile_midi(midi_file, track=0, transpose=0)
+            self.assertEqual(tuple(events), (262, 500, 294, 2000))
+
+    def test_14_song_file(self):
+        for transpose in (0, 6, 8):
+            events = compile_nokia(nokia_songs['pink_panther'], transpose=transpose)
+            data = songfile.dumps(events)
+            self.assertEqual(data[:4], b'BUZ1')
+            self.assertEqual(songfile.loads(data), events)
+        self.assertTrue(len(data) < len(nokia_songs['pink_panther']))
+        events = buzzer.compile_rtttl(songs.find('Entertainer'))
+        self.assertEqual(songfile.loads(songfile.dumps(events)), events)
+        with self.assertRaises(ValueError):
+            songfile.loads(b'MThd')
+
+    def test_14_play_song_file(self):
+        played = []
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard', callback=played.append)
+        events = compile_nokia(nokia_songs['imperial_march'])
+        filename = os.path.join(os.path.dirname(__file__), 'imperial_march.buz')
+        songfile.dump(events, filename)
+        try:
+            buzz.play_song_file(filename)
+        finally:
+            os.remove(filename)
+        self.assertEqual(played, [events[i] for i in range(0, len(events), 2)])
+
+    def test_15_song_bank(self):
+        rtttl = dict((song.split(':')[0], song) for song in songs.SONGS)
+        bank = songbank.SongBank(songbank.build(rtttl))
+        self.assertEqual(len(bank), len(rtttl))
+        self.assertEqual(list(bank.names()), sorted(rtttl))
+        for name, song in rtttl.items():
+            self.assertEqual(bytes(bank[name]), song.encode())
+        self.assertTrue('Entertainer' in bank)
+        self.assertFalse('Nothing' in bank)
+        self.assertEqual(bank.get('Nothing'), None)
+        with self.assertRaises(KeyError):
+            bank['Nothing']
+
+    def test_15_song_bank_file(self):
+        filename = os.path.join(os.path.dirname(__file__), 'nokia.bank')
+        songbank.write(nokia_songs, filename)
+        bank = songbank.SongBank(filename)
+        try:
+            for name, song in nokia_songs.items():
+                self.assertEqual(compile_nokia(bank[name]), compile_nokia(song))
+        finally:
+            bank.close()
+            os.remove(filename)
+        with self.assertRaises(ValueError):
+            songbank.SongBank(b'BUZ1\x00\x00')
+
+    def test_16_songs_find(self):
+        for song in songs.SONGS:
+            name = song.split(':')[0]
+            self.assertEqual(songs.find(name), song)
+            self.assertEqual(songs.find(name.upper(), ignore_case=True), song)
+        self.assertEqual(songs.find('entertainer'), None)
+        self.assertEqual(songs.find('Nothing', ignore_case=True), None)
+        names = [song.split(':')[0] for song in songs.find_prefix('smb')]
+        self.assertEqual(names, ['SMBtheme', 'SMBunderground', 'SMBwater'])
+        names = [song.split(':')[0] for song in songs.find_prefix('super mario - ')]
+        self.assertEqual(names, ['Super Mario - Main Theme', 'Super Mario - Title Music'])
+        self.assertEqual(list(songs.find_prefix('zzz')), [])
+        self.assertEqual(len(list(songs.find_prefix(''))), len(songs.SONGS))
+
+    def test_17_compile_rtttl(self):
+        from rtttl import RTTTL
+        for song in songs.SONGS:
+            events = buzzer.compile_rtttl(song)
+            notes = list(RTTTL(song).notes())
+            self.assertEqual(len(events), 2 * len(notes))
+            for i, (freq, msec) in enumerate(notes):
+                # rtttl.py has its own rounded frequencies
+                self.assertAlmostEqual(events[2 * i], freq, delta=freq / 200 + 1)
+                self.assertAlmostEqual(events[2 * i + 1], msec, delta=1)
+        self.assertEqual(buzzer.compile_rtttl(memoryview(songs.find('Entertainer').encode())),
+                         buzzer.compile_rtttl(songs.find('Entertainer')))
+        with self.assertRaises(ValueError):
+            buzzer.compile_rtttl('no colons')
+        self.assertEqual(list(buzzer.compile_rtttl('t:d=4,o=5,b=60:a,p,8a4', a4=432, transpose=1)),
+                         [1728, 1000, 0, 1000, 864, 500])
+
+    def test_18_integer_tempo(self):
+        tune = [('a4', 4), ('r', 8), (69, -4)]
+        self.assertEqual(tuple(compile_tune(100, tune)), (440, 600, 0, 300, 440, 900))
+        self.assertEqual(tuple(compile_tune('100', tune)), (440, 600, 0, 300, 440, 900))
+        self.assertEqual(tuple(compile_tune(126.5, tune)), (440, 474, 0, 237, 440, 711))
+        for n in range(128):
+            self.assertAlmostEqual(freq_table()[n], 440 * 2 ** ((n - 69) / 12.), delta=0.5)
+
+    def test_19_compile_voices(self):
+        if not buzzer.MidiFile:
+            return
+        from buzzer.poly import compile_voices
+        midi = buzzer.MidiFile(self.sample_file)
+        events = compile_voices(midi, (2, 3, 5), 3)
+        playing = [False] * 3
+        last = 0
+        chords = 0
+        for i in range(0, len(events), 3):
+            t, voice, freq = events[i], events[i + 1], events[i + 2]
+            self.assertTrue(t >= last)
+            self.assertTrue(voice < 3)
+            # a voice is only started when free and only silenced when playing
+            self.assertEqual(playing[voice], not freq)
+            playing[voice] = bool(freq)
+            if sum(playing) > 1:
+                chords += 1
+            last = t
+        self.assertEqual(playing, [False] * 3)
+        self.assertTrue(chords > 0)
+
+    def test_19_poly_player(self):
+        if not buzzer.MidiFile:
+            return
+        from buzzer.poly import PolyPlayer
+        from buzzer.backends import RecordingBackend, VirtualClock
+        clock = VirtualClock()
+        recorders = [RecordingBackend(clock=clock) for n in range(3)]
+        voices = [BuzzerPlayer(backend=recorder) for recorder in recorders]
+        PolyPlayer(voices).play_midi(self.sample_file, tracks=(5,))
+        events = buzzer.poly.compile_voices(buzzer.MidiFile(self.sample_file), (5,), 3)
+        end = events[-3] * 1000
+        for n, recorder in enumerate(recorders):
+            expected = [(events[i] * 1000, events[i + 2]) for i in range(0, len(events), 3) if events[i + 1] == n]
+            self.assertEqual([(t, freq) for t, freq, duty in recorder.writes()], expected + [(end, 0)])
+
+    def test_19_voices_doubled_note_on(self):
+        if not buzzer.MidiFile:
+            return
+        from buzzer.poly import compile_voices
+        # a second NOTE ON 60 at tick 0 ends the first one without duration
+        midi = buzzer.MidiFile(os.path.join(os.path.dirname(__file__), 'doubled_note.mid'))
+        events = compile_voices(midi, (0,), 1)
+        table = freq_table(buzzer.A4)
+        self.assertEqual(list(events), [0, 0, midi_freq(60 + 72, table), 500, 0, 0,
+                                        500, 0, midi_freq(62 + 72, table), 1000, 0, 0])
+
+    def test_20_compile_chords(self):
+        if not buzzer.MidiFile:
+            return
+        from buzzer.poly import compile_chords
+        midi = buzzer.MidiFile(self.sample_file)
+        chords, events = compile_chords(midi, (5,))
+        self.assertEqual(len(chords[0]), 0)
+        self.assertTrue(max(len(chord) for chord in chords) >= 3)
+        self.assertEqual(sum(events[i] for i in range(1, len(events), 2)),
+                         midi.tick_ms(max(note.get_end() for note in midi.read_notes(5))))
+        for i in range(2, len(events), 2):
+            self.assertTrue(events[i] != events[i - 2])
+
+    def test_20_arpeggio(self):
+        if not buzzer.MidiFile:
+            return
+        from buzzer.poly import arpeggiate
+        from buzzer.backends import RecordingBackend
+        recorder = RecordingBackend()
+        buzz = BuzzerPlayer(backend=recorder)
+        chords = [buzzer.array('H'), buzzer.array('H', (440, 550, 660)), buzzer.array('H', (880,))]
+        arpeggiate(buzz, chords, buzzer.array('I', (1, 100, 0, 30, 2, 50)), rate=50)
+        log = [(t, freq) for t, freq, duty in recorder.writes()]
+        self.assertRaises(NotImplementedError, buzz.play_midi, self.sample_file, arpeggio=50, background=True)
+        self.assertEqual(log, [(0, 440), (20000, 550), (40000, 660), (60000, 440), (80000, 550),
+                               (100000, 0), (130000, 880), (180000, 0)])
+
+        # the callback and the trace get each chord once
+        from buzzer.deferred import DeferredCallback
+        from buzzer.trace import TraceRing, NOTE
+        played = []
+        ring = TraceRing()
+        buzz = BuzzerPlayer(backend=RecordingBackend(), callback=DeferredCallback(played.append), trace=ring)
+        arpeggiate(buzz, chords, buzzer.array('I', (1, 100, 0, 30, 2, 50)), rate=50)
+        self.assertEqual(played, [440, 0, 880])
+        self.assertEqual(ring.events(), [(NOTE, 440, 100), (NOTE, 0, 30), (NOTE, 880, 50)])
+
+    def test_21_backends(self):
+        from buzzer import backends
+        self.assertEqual(BuzzerPlayer(platform='linux').platform, buzzer.PLATFORM_null)
+        self.assertRaises(NotImplementedError, BuzzerPlayer, platform='amiga')
+        recorder = backends.RecordingBackend()
+        buzz = BuzzerPlayer(backend=recorder)
+        self.assertEqual(buzz.articulation, recorder.articulation)
+        buzz.play_compiled(buzzer.array('I', (440, 100, 0, 50, 880, 100)))
+        self.assertEqual(recorder.writes(), [(0, 440, 30), (90000, 0, 0), (100000, 0, 0), (145000, 0, 0),
+                                             (150000, 880, 30), (240000, 0, 0), (250000, 0, 0), (250000, 0, 0)])
+        # without a timer nothing would ever advance background playback,
+        # and the first note isn't left on
+        recorder = backends.RecordingBackend()
+        buzz = BuzzerPlayer(backend=recorder)
+        self.assertRaises(NotImplementedError, buzz.play_compiled, buzzer.array('I', (440, 100)), background=True)
+        self.assertEqual(recorder.writes(), [(0, 440, 30), (0, 0, 0)])
+
+    def test_22_virtual_clock_corpus(self):
+        from buzzer.backends import RecordingBackend
+        corpus = [compile_nokia(song) for name, song in sorted(nokia_songs.items())]
+        corpus += [buzzer.compile_rtttl(song) for song in songs.SONGS]
+        for events in corpus:
+            recorder = RecordingBackend()
+            buzz = BuzzerPlayer(backend=recorder)
+            buzz.play_compiled(events)
+            total = sum(events[i] for i in range(1, len(events), 2)) * 1000
+            self.assertEqual(recorder.clock.now, total)
+            self.assertEqual(tuple(buzz.lateness), (0,) * (len(events) // 2))
+            writes = recorder.writes()
+            self.assertEqual(writes[-1], (total, 0, 0))
+            # every note starts exactly on the sum of the durations before it
+            start = 0
+            tones = [(t, freq) for t, freq, duty in writes if duty]
+            expected = []
+            for i in range(0, len(events), 2):
+                if events[i]:
+                    expected.append((start, events[i]))
+                start += events[i + 1] * 1000
+            self.assertEqual(tones, expected)
+
+    def test_23_wav(self):
+        try:
+            from buzzer.wav import WavBackend
+        except ImportError:  # no NumPy
+            return
+        backend = WavBackend(rate=8000)
+        BuzzerPlayer(backend=backend).play_compiled(buzzer.array('I', (400, 100, 0, 50)))
+        samples = backend.render()
+        self.assertEqual(len(samples), 1200)
+        # 90 ms of tone, 20 samples a period with 30% of them high
+        tone = samples[:720]
+        self.assertEqual(int((tone > 0).sum()), 36 * 6)
+        self.assertEqual(int((tone < 0).sum()), 36 * 14)
+        self.assertEqual(int(abs(samples[720:]).sum()), 0)
+
+    def test_24_playlist(self):
+        from buzzer.backends import RecordingBackend
+        from buzzer.playlist import Playlist
+        rtttl = songs.find('Entertainer')
+        nokia = nokia_songs['pink_panther']
+        expected = [compile_nokia(nokia), buzzer.compile_rtttl(rtttl), compile_nokia(nokia),
+                    compile_tune(60, list(nokia_tune(nokia))[1:], transpose=6),
+                    buzzer.compile_rtttl(rtttl), compile_nokia(nokia)]
+        bank = songbank.SongBank(songbank.build({'Entertainer': rtttl, 'pink_panther': nokia}))
+        recorder = RecordingBackend()
+        buzz = BuzzerPlayer(backend=recorder)
+        playlist = Playlist(buzz, [nokia, rtttl, lambda: compile_nokia(nokia)])
+        playlist.add((60, nokia))
+        # memoryviews into the bank
+        playlist.add(bank['Entertainer'])
+        playlist.add(bank['pink_panther'])
+        self.assertEqual(len(playlist), 6)
+        compiled = []
+        play_compiled = buzz.play_compiled
+
+        def record(events, idle=None):
+            # the next song is fully compiled in the waits of this one
+            compiled.append(events)
+            play_compiled(events, idle=idle)
+            self.assertTrue(playlist._steps is None)
+            self.assertTrue(len(playlist) == 0 or playlist.next)
+
+        buzz.play_compiled = record
+        playlist.play()
+        self.assertEqual(compiled, expected)
+        self.assertEqual(len(playlist), 0)
+        # each song starts right when the previous one ends
+        total = sum(events[i] for events in expected for i in range(1, len(events), 2)) * 1000
+        self.assertEqual(recorder.clock.now, total)
+
+    def test_25_trace(self):
+        from buzzer.backends import RecordingBackend
+        from buzzer.trace import TraceRing, SONG, TEMPO, NOTE
+        ring = TraceRing(size=4)
+        buzz = BuzzerPlayer(backend=RecordingBackend(), trace=ring)
+        buzz.play_tune(120, [('c4', 4), ('r', 8)], name='two')
+        self.assertEqual(ring.events(), [(SONG, 'two', 0), (TEMPO, 120, 0), (NOTE, 262, 500), (NOTE, 0, 250)])
+        self.assertEqual(ring.dropped, 0)
+        buzz.play_compiled(buzzer.array('I', (440, 10, 880, 20)))
+        self.assertEqual(ring.events(), [(NOTE, 262, 500), (NOTE, 0, 250), (NOTE, 440, 10), (NOTE, 880, 20)])
+        self.assertEqual(ring.dropped, 2)
+        ring.clear()
+        buzz.play_rtttl('Two:d=4,o=5,b=140:c,p')
+        self.assertEqual(ring.events()[:2], [(SONG, 'Two', 0), (TEMPO, 140, 0)])
+        ring.clear()
+        buzz.play_tune(120, [('c4', 4), ('r', 8)], name='two')
+        buzz.play_compiled(buzzer.array('I', (440, 10, 880, 20)))
+        lines = []
+        ring.dump(lines.append)
+        self.assertEqual(lines, ['(2 older events dropped)', 'note 262 Hz 500 ms', 'note 0 Hz 250 ms',
+                                 'note 440 Hz 10 ms', 'note 880 Hz 20 ms'])
+
+    def test_26_deferred_callback(self):
+        from buzzer.backends import RecordingBackend
+        from buzzer.deferred import DeferredCallback
+        recorder = RecordingBackend()
+        ran = []
+
+        def slow_callback(freq):
+            ran.append(freq)
+            recorder.clock.now += 3000
+
+        deferred = DeferredCallback(slow_callback, margin_us=5000)
+        buzz = BuzzerPlayer(callback=deferred, backend=recorder)
+        events = compile_nokia(nokia_songs['imperial_march'])
+        buzz.play_compiled(events)
+        # the callbacks ran in the waits, no note started late
+        self.assertEqual(tuple(buzz.lateness), (0,) * (len(events) // 2))
+        self.assertEqual(ran, [events[i] or buzz.min_freq for i in range(0, len(events), 2)])
+        self.assertEqual(deferred.overflows, 0)
+
+        deferred = DeferredCallback(ran.append, size=2)
+        for freq in (1, 2, 3):
+            deferred(freq)
+        self.assertEqual((len(deferred), deferred.overflows), (2, 1))
+        del ran[:]
+        self.assertEqual(deferred.dispatch(), 2)
+        self.assertEqual(ran, [1, 2])
+
+        # background playback queues them from its timer interrupt
+        buzz = BuzzerPlayer(1, 2, 4, platform='pyboard', callback=deferred)
+        playback = buzz.play_compiled(buzzer.array('I', (440, 2, 0, 1)), background=True)
+        while playback.is_playing:
+            playback._tick(None)
+        deferred.dispatch()
+        self.assertEqual(ran, [1, 2, 440, 0])
+
 
 if __name__ == "__main__":
     unittest.main()
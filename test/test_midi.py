@@ -1,16 +1,12 @@
 import os.path
 import unittest
 
-from midi import MidiFile
+from midi import MidiFile, read_variable_length
 
 #import logging
 #logging.basicConfig(level=logging.DEBUG)
 
 
-def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
-    return abs(a-b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
-
-
 class TestMidi(unittest.TestCase):
     sample_file = os.path.join(os.path.dirname(__file__), 'Zlilmehuvan.mid')
 
@@ -27,17 +23,104 @@ class TestMidi(unittest.TestCase):
     def test_03_read_track(self):
         m = MidiFile(self.sample_file)
         notes = m.read_track(1)
-        for n, expected in zip(notes[:4], (('r', 0.4343891402714933), ('c2', 1.116279069767441), ('r', 48.00000000000171), ('f1', 1.499999999999998))):
+        # c2, f1
+        for n, expected in zip(notes[:4], (('r', 1105), (36, 430), ('r', 10), (29, 320))):
             self.assertEqual(n[0], expected[0])
-            self.assertTrue(isclose(n[1], n[1]))
+            self.assertEqual(n[1], expected[1])
 
     def test_04_midi_offs(self):
         midi_file = os.path.join(os.path.dirname(__file__), 'clock_tower_short.mid')
         m = MidiFile(midi_file)
         notes = m.read_track(1)
-        for n, expected in zip(notes[:4], (('r', 2.2857142857142856), ('f#5', 4.0), ('r', 8.0), ('d5', 4.0))):
+        # f#5, d5
+        for n, expected in zip(notes[:4], (('r', 840), (78, 480), ('r', 240), (74, 480))):
             self.assertEqual(n[0], expected[0])
-            self.assertTrue(isclose(n[1], n[1]))
+            self.assertEqual(n[1], expected[1])
+
+    def test_05_read_variable_length(self):
+        data = b'\x00\x7f\x81\x00\xff\x7f\x81\x80\x80\x00'
+        for pos, expected, next_pos in ((0, 0, 1), (1, 0x7f, 2), (2, 0x80, 4), (4, 0x3fff, 6), (6, 0x200000, 10)):
+            num, end = read_variable_length(data, pos)
+            self.assertEqual(num, expected)
+            self.assertEqual(end, next_pos)
+
+    def test_06_header(self):
+        m = MidiFile(self.sample_file)
+        self.assertEqual(m.format, 1)
+        self.assertEqual(m.track_count, 17)
+        self.assertEqual(m.time_division, 120)
+        m.read_track(1)
+        self.assertEqual(int(m.tempo), 126)
+
+    def test_07_all_tracks(self):
+        m = MidiFile(self.sample_file)
+        for track_num in range(m.track_count):
+            for pitch, ticks in m.read_track(track_num):
+                self.assertTrue(pitch == 'r' or 0 <= pitch < 128)
+                self.assertTrue(ticks > 0)
+
+    def test_08_tick_ms(self):
+        midi_file = os.path.join(os.path.dirname(__file__), 'clock_tower_short.mid')
+        m = MidiFile(midi_file)
+        m.read_track(1)
+        self.assertEqual(m.tick_ms(m.time_division), m.us_per_quarter // 1000)
+
+    def test_09_note_offs_paired(self):
+        m = MidiFile(self.sample_file)
+        captured = []
+        parse_into_song = m.parse_into_song
+        m.parse_into_song = lambda track: captured.append(track) or parse_into_song(track)
+        for track_num in (2, 3, 5):
+            song = m.read_track(track_num)
+            notes = captured[-1]
+            self.assertTrue(notes)
+            for note in notes:
+                # the file has notes switched off on the tick they start
+                self.assertTrue(note.duration >= 0)
+                self.assertTrue(note.velocity > 0)
+            # overlapping notes are cut, so the song lasts as long as the track
+            self.assertEqual(sum(ticks for _, ticks in song), max(note.get_end() for note in notes))
+
+    def test_10_track_chunks(self):
+        m = MidiFile(self.sample_file)
+        self.assertEqual(len(m.track_chunks), m.track_count)
+        offset, length = m.track_chunks[0]
+        self.assertEqual(offset, 14 + 8)
+        self.assertEqual(m.track_chunks[1][0], offset + length + 8)
+        with open(self.sample_file, 'rb') as f:
+            for offset, length in m.track_chunks:
+                f.seek(offset - 8)
+                self.assertEqual(f.read(4), b'MTrk')
+        # random access gives the same notes as reading in order
+        m.read_track(16)
+        self.assertEqual(str(m.read_track(5)), str(MidiFile(self.sample_file).read_track(5)))
+        self.assertEqual(int(m.tempo), 126)
+
+    def test_11_tempo_map(self):
+        # 120bpm for the first quarter note, 60bpm for the next half note
+        m = MidiFile(os.path.join(os.path.dirname(__file__), 'tempo_change.mid'))
+        notes = m.read_track(0)
+        self.assertEqual(str(notes), str([(60, 96), (62, 192)]))
+        self.assertEqual(len(m.tempo_map), 2)
+        self.assertEqual(m.tick_ms(0), 0)
+        self.assertEqual(m.tick_ms(48), 250)
+        self.assertEqual(m.tick_ms(96), 500)
+        self.assertEqual(m.tick_ms(288), 2500)
+
+    def test_12_same_tick_note_offs(self):
+        directory = os.path.dirname(__file__)
+        # NOTE ON 60 twice at tick 0: the first one ends there, the NOTE OFF
+        # at tick 96 ends the second one
+        m = MidiFile(os.path.join(directory, 'doubled_note.mid'))
+        self.assertEqual(str([(n.pitch, n.start, n.duration) for n in m.read_notes(0)]),
+                         str([(60, 0, 0), (60, 0, 96), (62, 96, 96)]))
+        self.assertEqual(str(m.read_track(0)), str([(60, 96), (62, 96)]))
+        # NOTE ON and NOTE OFF 60 at tick 0 without a retrigger, a note
+        # without duration that leaves a rest
+        m = MidiFile(os.path.join(directory, 'zero_length_note.mid'))
+        self.assertEqual(str([(n.pitch, n.start, n.duration) for n in m.read_notes(0)]),
+                         str([(60, 0, 0), (62, 96, 96)]))
+        self.assertEqual(str(m.read_track(0)), str([('r', 96), (62, 96)]))
 
 
 if __name__ == "__main__":
@@ -3,3 +3,12 @@ def sleep_ms(t):
 
 def sleep_us(t):
     pass
+
+def ticks_us():
+    return 0
+
+def ticks_diff(a, b):
+    return a - b
+
+def ticks_add(a, b):
+    return a + b